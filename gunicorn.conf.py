@@ -0,0 +1,21 @@
+# Gunicorn configuration for the Bilal backend.
+# Usage: gunicorn -c gunicorn.conf.py server:app
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+# Import server.py (Flask, SoCo, APScheduler) once in the master and share it with workers
+preload_app = True
+
+# The scheduler must not start in the master: its thread would not survive the fork.
+# server.py skips the import-time start when this is set and post_fork takes over.
+os.environ['BILAL_DEFER_SCHEDULER'] = '1'
+
+
+def post_fork(server, worker):
+    import server as bilal
+    # Only one worker wins the scheduler lock socket; the others skip it
+    bilal._try_start_scheduler_with_lock()
+    bilal.warmup_sonos()
@@ -1,5 +1,6 @@
 import { Coordinates, CalculationMethod, PrayerTimes, Madhab } from 'adhan';
 import process from 'process';
+import readline from 'readline';
 
 function computeForDate(dateStr) {
   const coords = new Coordinates(25.2048, 55.2708);
@@ -24,10 +25,26 @@ function computeForDate(dateStr) {
 }
 
 const arg = process.argv[2];
-try {
-  const res = computeForDate(arg);
-  console.log(JSON.stringify(res));
-} catch (e) {
-  console.error(JSON.stringify({ error: String(e) }));
-  process.exit(2);
+if (arg === '--server') {
+  // Persistent mode used by server.py: one JSON request per stdin line ({"date": "YYYY-MM-DD"|null}),
+  // one JSON response per stdout line.
+  const rl = readline.createInterface({ input: process.stdin });
+  rl.on('line', (line) => {
+    let res;
+    try {
+      const req = line.trim() ? JSON.parse(line) : {};
+      res = computeForDate(req.date);
+    } catch (e) {
+      res = { error: String(e) };
+    }
+    process.stdout.write(JSON.stringify(res) + '\n');
+  });
+} else {
+  try {
+    const res = computeForDate(arg);
+    console.log(JSON.stringify(res));
+  } catch (e) {
+    console.error(JSON.stringify({ error: String(e) }));
+    process.exit(2);
+  }
 }
@@ -1,94 +1,340 @@
 import os
+import sys
 import time
 import threading
 import logging
+import logging.handlers
+import atexit
 import socket
+import errno
+import fcntl
+import ipaddress
 import json
-import subprocess
+import hashlib
+import queue
+import bisect
+import functools
+import importlib.util
+import select
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime, date, timedelta
-from flask import Flask, send_from_directory, jsonify, request
+from flask import Flask, Response, send_file, send_from_directory, jsonify, request, abort
 from subprocess import PIPE, Popen
 
 # Optional scheduler/prayer time imports (installed by install.sh)
 try:
     from apscheduler.schedulers.background import BackgroundScheduler
     from apscheduler.triggers.date import DateTrigger
-    from apscheduler.triggers.interval import IntervalTrigger
+    from apscheduler.triggers.cron import CronTrigger
     import praytimes
     from tzlocal import get_localzone
-    import fcntl
     SCHEDULER_AVAILABLE = True
 except Exception:
     SCHEDULER_AVAILABLE = False
 
+# Optional persistent job store for the scheduler. Jobs are kept in memory unless
+# BILAL_PERSIST_JOBS=1, so SQLAlchemy is only imported when it will be used.
+PERSIST_JOBS = os.environ.get('BILAL_PERSIST_JOBS') == '1'
+SQLAlchemyJobStore = None
+if PERSIST_JOBS:
+    try:
+        from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+        from sqlalchemy import create_engine, event as sa_event
+    except Exception:
+        SQLAlchemyJobStore = None
+
+# Optional C-accelerated JSON encoder for API responses
+try:
+    import orjson
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:
+    orjson = None
+
+# Optional in-process inspection of port listeners
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Optional interface enumeration for LAN IP detection
+try:
+    import netifaces
+except ImportError:
+    netifaces = None
+
+# Optional MP3 header parsing to know the Azan lengths up front
+try:
+    from mutagen.mp3 import MP3
+except ImportError:
+    MP3 = None
+
+# JSON helpers for history/cache files and the Node helper protocol (orjson when available)
+if orjson is not None:
+    def _json_dumps(obj):
+        return orjson.dumps(obj).decode('utf-8')
+    _json_loads = orjson.loads
+else:
+    _json_dumps = json.dumps
+    _json_loads = json.loads
+
+# Import SoCo eagerly so gunicorn's preload pays the import cost once in the master
+try:
+    import soco
+    from soco.snapshot import Snapshot
+except ImportError:
+    soco = None
+    Snapshot = None
+
 # Configure Logging
+# Callers only enqueue records; a background QueueListener does the file and stream
+# writes so SD-card I/O stays off the request and monitor threads.
+# The gunicorn master and every worker append to the same sys.log, so no process may rotate
+# it itself: WatchedFileHandler only appends and reopens the file after an external
+# rotation (logrotate with create/copytruncate).
+os.makedirs("logs", exist_ok=True)
+_LOG_HANDLERS = (
+    logging.handlers.WatchedFileHandler("logs/sys.log"),
+    logging.StreamHandler()
+)
+_LOG_QUEUE_HANDLER = logging.handlers.QueueHandler(queue.Queue(-1))
+# LOG_LEVEL accepts a level name (DEBUG, INFO, ...) or number; production default is INFO.
+# BILAL_DEBUG=1 is a shortcut for LOG_LEVEL=DEBUG.
+_LOG_LEVEL_ENV = os.environ.get('LOG_LEVEL') or ('DEBUG' if os.environ.get('BILAL_DEBUG') else 'INFO')
+LOG_LEVEL = int(_LOG_LEVEL_ENV) if _LOG_LEVEL_ENV.isdigit() else getattr(logging, _LOG_LEVEL_ENV.upper(), logging.INFO)
+# The log format uses none of these record fields; skip collecting them for every record
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=LOG_LEVEL,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/sys.log"),
-        logging.StreamHandler()
-    ]
+    handlers=[_LOG_QUEUE_HANDLER]
 )
+_LOG_LISTENER = None
+
+def _start_log_listener():
+    global _LOG_LISTENER
+    _LOG_LISTENER = logging.handlers.QueueListener(_LOG_QUEUE_HANDLER.queue, *_LOG_HANDLERS)
+    _LOG_LISTENER.start()
+
+def _restart_log_listener_after_fork():
+    # The listener thread does not survive fork (gunicorn preload); give the child its own
+    _LOG_QUEUE_HANDLER.queue = queue.Queue(-1)
+    _start_log_listener()
+
+_start_log_listener()
+atexit.register(lambda: _LOG_LISTENER.stop())
+os.register_at_fork(after_in_child=_restart_log_listener_after_fork)
 logger = logging.getLogger("BilalServer")
 
-# Safely handle any stale process on port 5000, but only once per host boot/service install.
-# Create a lightweight marker file in /tmp to avoid repeated kills during rapid restarts.
-PORT_CHECK_MARKER = '/tmp/bilalv3_port_check_done'
-if not os.path.exists(PORT_CHECK_MARKER):
+# Safely handle any stale process on port 5000. A bind probe tells us whether the port is
+# taken without forking `ss`; psutil (optional) then identifies the listener in-process.
+def _port_in_use(port):
+    probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     try:
-        # Use `ss` to inspect listening processes on port 5000 (may require sudo to show all details).
-        ss = subprocess.run(['ss', '-ltnp', 'sport = :5000'], check=False, capture_output=True, text=True)
-        ss_out = (ss.stdout or '') + (ss.stderr or '')
-        if not ss_out.strip():
-            logger.info("Port 5000 appears free")
-        else:
-            curpid = str(os.getpid())
+        # SO_REUSEADDR so lingering TIME_WAIT connections are not mistaken for a listener
+        probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        probe.bind(('0.0.0.0', port))
+        return False
+    except OSError as e:
+        return e.errno == errno.EADDRINUSE
+    finally:
+        probe.close()
+
+# Killing whatever else holds the port is opt-in; by default startup aborts instead
+KILL_STALE_PORT = os.environ.get('BILAL_KILL_STALE_PORT') == '1'
+
+def _release_stale_port(port=5000):
+    if not _port_in_use(port):
+        logger.info(f"Port {port} appears free")
+        return
+    if psutil is None:
+        logger.warning(f"Port {port} is in use but psutil is not installed; not killing")
+        return
+    curpid = os.getpid()
+    for conn in psutil.net_connections(kind='tcp'):
+        if conn.status != psutil.CONN_LISTEN or not conn.laddr or conn.laddr.port != port:
+            continue
+        pid = conn.pid
+        if pid is None:
+            logger.warning(f"Port {port} listener pid not visible (insufficient permissions); not killing")
+        elif pid == curpid:
             # If current process is already using the port, do nothing.
-            if curpid in ss_out:
-                logger.info(f"Port 5000 is in use by current process (pid {curpid}); not killing")
-            # If output references obvious bilal identifiers, avoid killing.
-            elif 'server.py' in ss_out or 'bilal-beapp' in ss_out:
-                logger.info("Port 5000 is in use by a bilal process; not killing")
-            else:
-                logger.info("Port 5000 is in use by another process; killing stale process(es)")
+            logger.info(f"Port {port} is in use by current process (pid {curpid}); not killing")
+        else:
+            try:
+                cmdline = ' '.join(psutil.Process(pid).cmdline())
+            except psutil.Error:
+                cmdline = ''
+            # If the listener is a bilal process, avoid killing.
+            if 'server.py' in cmdline or 'server:app' in cmdline or 'bilal-beapp' in cmdline:
+                logger.info(f"Port {port} is in use by a bilal process (pid {pid}); not killing")
+                continue
+            if not KILL_STALE_PORT:
+                logger.error(f"Port {port} is in use by another process (pid {pid}: {cmdline or 'unknown'}); "
+                             f"exiting (set BILAL_KILL_STALE_PORT=1 to terminate it instead)")
+                sys.exit(1)
+            logger.info(f"Port {port} is in use by another process (pid {pid}); killing stale process")
+            try:
+                proc = psutil.Process(pid)
+                proc.terminate()
+                # Give it a moment to release the socket so our own bind does not race it;
+                # escalate to SIGKILL if it ignores SIGTERM
                 try:
-                    subprocess.run(['fuser', '-k', '5000/tcp'], check=False)
-                    logger.info("Killed stale process(es) on port 5000")
-                except Exception as e:
-                    logger.warning(f"Failed to kill stale process on port 5000: {e}")
-        # Write marker so this check won't run again until marker is removed
-        try:
-            with open(PORT_CHECK_MARKER, 'w') as f:
-                f.write(f"checked_by_pid:{os.getpid()}\n")
-        except Exception as e:
-            logger.warning(f"Failed to write port check marker: {e}")
+                    proc.wait(timeout=0.5)
+                except psutil.TimeoutExpired:
+                    proc.kill()
+                    proc.wait(timeout=2)
+                logger.info(f"Killed stale process {pid} on port {port}")
+            except psutil.TimeoutExpired:
+                logger.warning(f"Stale process {pid} on port {port} did not exit after SIGKILL")
+            except Exception as e:
+                logger.warning(f"Failed to kill stale process on port {port}: {e}")
+
+# Only the process that will own port 5000 (the dev server or the gunicorn master, which
+# imports the app before binding) checks it; plain imports from tools skip the probe.
+if __name__ == '__main__' or 'gunicorn' in sys.argv[0]:
+    try:
+        _release_stale_port(5000)
     except Exception as e:
         logger.warning(f"Failed to inspect/handle port 5000: {e}")
-else:
-    logger.info("Port check already completed previously; skipping port-kill logic")
 
 app = Flask(__name__, static_folder='.')
+# When fronted by a proxy that honours X-Sendfile (e.g. nginx/Apache), let it serve files
+app.config['USE_X_SENDFILE'] = os.environ.get('BILAL_X_SENDFILE') == '1'
+
+if orjson is not None:
+    class ORJSONProvider(DefaultJSONProvider):
+        """Flask JSON provider backed by orjson (falls back to Flask's default for unknown types)."""
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+    app.json_provider_class = ORJSONProvider
+    app.json = ORJSONProvider(app)
 
 # Global State
-SONOS_SNAPSHOT = {}  # Store zone snapshots: {uid: {volume, uri, position}}
-PLAYBACK_ACTIVE = False
-AZAN_LOCK = False  # Prevent music/radio playback during Azan
-AZAN_STARTED = False  # True when initial Azan start succeeded (prevents retries)
-STATIC_ZONE_NAMES = [
+@dataclass
+class AzanState:
+    """Azan playback state shared by request handlers, scheduled jobs and the monitor.
+
+    Fields are only changed while holding `lock`. Each cycle's speaker snapshot is not kept
+    here; `_start_azan` hands it straight to that cycle's monitor.
+    """
+    locked: bool = False  # Prevent music/radio playback during Azan
+    started: bool = False  # True when initial Azan start succeeded (prevents retries)
+    stop: threading.Event = field(default_factory=threading.Event)  # set by /api/cancel to end the Azan early
+    cancel_sock: socket.socket = field(default=None, repr=False)  # bound to AZAN_CANCEL_NAME while locked
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def try_acquire(self):
+        """Atomically claim the Azan slot; returns False if an Azan is already in progress
+        in this or any other process."""
+        with self.lock:
+            if self.locked:
+                return False
+            sock = _claim_azan_cancel_socket()
+            if sock is None:
+                return False
+            self.cancel_sock = sock
+            self.locked = True
+            self.started = False
+            # A fresh Azan starts uncancelled; a cancel that arrives before its monitor runs stays set
+            self.stop.clear()
+            return True
+
+    def release(self):
+        with self.lock:
+            self.locked = False
+            sock, self.cancel_sock = self.cancel_sock, None
+        if sock is not None:
+            sock.close()
+
+AZAN = AzanState()
+_MONITOR_SUB = None  # the running monitor's AVTransport subscription, so a cancel can wake it
+
+# The process playing an Azan binds this abstract UNIX socket name for as long as it holds
+# the slot. Any gunicorn worker can then route /api/cancel to it, and a second worker cannot
+# start an overlapping Azan.
+AZAN_CANCEL_NAME = '\0bilal-azan-cancel'
+
+def _claim_azan_cancel_socket():
+    """Bind AZAN_CANCEL_NAME and start its listener; returns None if another process holds it."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        sock.bind(AZAN_CANCEL_NAME)
+    except OSError:
+        sock.close()
+        return None
+    # Short timeout so the listener notices when release() closes the socket
+    sock.settimeout(1.0)
+    threading.Thread(target=_azan_cancel_listener, args=(sock,), name='azan-cancel', daemon=True).start()
+    return sock
+
+def _azan_cancel_listener(sock):
+    while True:
+        try:
+            msg = sock.recv(64)
+        except socket.timeout:
+            if sock.fileno() == -1:
+                return
+            continue
+        except OSError:
+            return
+        if msg == b'cancel':
+            logger.info("Azan cancel received")
+            AZAN.stop.set()
+            sub = _MONITOR_SUB
+            if sub is not None:
+                # Wake the monitor's event wait now instead of at the next heartbeat
+                sub.events.put(None)
+
+
+STATIC_ZONE_ORDER = (
     "Pool",
     "Boy 1",
     "Boy 2",
     "Girls Room",
     "Living Room",
     "Master Bedroom"
-]
+)
+STATIC_ZONE_NAMES = frozenset(STATIC_ZONE_ORDER)  # membership checks; ORDER keeps the UI order
+# Hard per-call timeout (seconds) for SoCo SOAP/HTTP requests so an unresponsive
+# speaker cannot stall discovery, grouping or the playback monitor.
+SONOS_REQUEST_TIMEOUT = float(os.environ.get('SONOS_REQUEST_TIMEOUT', '2.0'))
 
 # ---------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------
-def get_local_ip():
-    """Get the Raspberry Pi's local IP address."""
+_LOCAL_IP = None
+_LOCAL_IP_TS = 0.0
+LOCAL_IP_TTL = float(os.environ.get('LOCAL_IP_TTL', '60'))  # re-detect periodically so a DHCP lease change is picked up
+
+def _detect_local_ip():
+    """Return the LAN IPv4 address, or None if none is found.
+
+    Prefers the interface of the default IPv4 route (what the routing probe below picks);
+    otherwise the first private address that is neither loopback nor link-local (169.254/16).
+    """
+    if netifaces is not None:
+        try:
+            interfaces = netifaces.interfaces()
+            default = netifaces.gateways().get('default', {}).get(netifaces.AF_INET)
+            if default and default[1] in interfaces:
+                # Check the default-route interface first; bridges (docker0, ...) come later
+                interfaces = [default[1]] + [i for i in interfaces if i != default[1]]
+            for iface in interfaces:
+                for a in netifaces.ifaddresses(iface).get(netifaces.AF_INET, []):
+                    addr = ipaddress.ip_address(a.get('addr', ''))
+                    if addr.is_private and not addr.is_loopback and not addr.is_link_local:
+                        return str(addr)
+        except Exception as e:
+            logger.warning(f"Interface enumeration failed: {e}")
+    # Fallback: let the routing table pick the outbound interface (no packet is sent)
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         s.connect(("8.8.8.8", 80))
@@ -96,69 +342,434 @@ def get_local_ip():
         s.close()
         return ip
     except Exception:
-        return "127.0.0.1"
+        return None
+
+def get_local_ip():
+    """Get the Raspberry Pi's local IP address (cached for LOCAL_IP_TTL seconds)."""
+    global _LOCAL_IP, _LOCAL_IP_TS
+    if _LOCAL_IP is None or time.monotonic() - _LOCAL_IP_TS >= LOCAL_IP_TTL:
+        ip = _detect_local_ip()
+        if ip != _LOCAL_IP and ip is not None:
+            logger.info(f"Local IP detected: {ip}")
+        # Keep the last good address if re-detection fails (e.g. gateway briefly unreachable)
+        _LOCAL_IP = ip or _LOCAL_IP
+        _LOCAL_IP_TS = time.monotonic()
+    # Do not cache the loopback fallback so a later call can pick up the LAN address
+    return _LOCAL_IP or "127.0.0.1"
+
+def invalidate_local_ip():
+    """Forget the cached IP (e.g. after a network change) so the next call re-detects it."""
+    global _LOCAL_IP
+    _LOCAL_IP = None
+
+class RateLimitedLogger:
+    """Wrap a logger and drop repeats of the same message key within `interval` seconds."""
+    def __init__(self, logger, interval=5.0):
+        self._logger = logger
+        self._interval = interval
+        self._last = {}
+
+    def log(self, level, key, msg, *args):
+        now = time.monotonic()
+        if now - self._last.get(key, float('-inf')) >= self._interval:
+            self._last[key] = now
+            self._logger.log(level, msg, *args)
+
+# Pools for fanning per-speaker SOAP calls out in parallel (threads start lazily, so
+# creating them at import is safe with gunicorn's preload fork). SONOS_EXECUTOR serves
+# /api/zones polling (two calls per zone); the Azan's prepare, snapshot and restore fan-outs
+# get their own pool so a burst of polls can never delay them.
+SONOS_EXECUTOR = ThreadPoolExecutor(max_workers=max(8, 2 * len(STATIC_ZONE_NAMES)), thread_name_prefix='sonos')
+AZAN_SONOS_EXECUTOR = ThreadPoolExecutor(max_workers=max(8, len(STATIC_ZONE_NAMES)), thread_name_prefix='sonos-azan')
+SONOS_FANOUT_TIMEOUT = 3.0
+
+def _for_each_speaker(fn, speakers, timeout=SONOS_FANOUT_TIMEOUT):
+    """Run `fn(speaker)` for all speakers in parallel on AZAN_SONOS_EXECUTOR.
+
+    Returns a list of `(speaker, result, error)` tuples in input order; `error` is the
+    raised exception (or a TimeoutError if the call did not finish within `timeout`).
+    """
+    futures = [(s, AZAN_SONOS_EXECUTOR.submit(fn, s)) for s in speakers]
+    deadline = time.monotonic() + timeout
+    results = []
+    for s, fut in futures:
+        try:
+            results.append((s, fut.result(timeout=max(0.0, deadline - time.monotonic())), None))
+        except Exception as e:
+            results.append((s, None, e))
+    return results
 
-def get_sonos_speakers():
+# Discovery results are reused for SONOS_CACHE_TTL seconds. Discovery is single-flight:
+# the first caller after expiry runs the scan while later callers wait on its Event (up to
+# SONOS_DISCOVERY_WAIT seconds) and share the result, instead of each flooding SSDP.
+SONOS_CACHE_TTL = float(os.environ.get('SONOS_CACHE_TTL') or os.environ.get('SONOS_DISCOVERY_TTL') or '60')
+SONOS_DISCOVERY_WAIT = 16.0
+_SPEAKER_CACHE = {"ts": 0.0, "zones": [], "ips": frozenset()}  # ips: every player in the topology
+_SPEAKER_CACHE_LOCK = threading.Lock()
+_DISCOVERY_IN_FLIGHT = None  # threading.Event while a discovery is running
+
+def get_sonos_speakers(force_refresh=False):
+    """Return Sonos speakers, reusing a recent discovery unless `force_refresh` is set."""
+    global _DISCOVERY_IN_FLIGHT
+    with _SPEAKER_CACHE_LOCK:
+        zones = _SPEAKER_CACHE["zones"]
+        if not force_refresh and zones and time.monotonic() - _SPEAKER_CACHE["ts"] < SONOS_CACHE_TTL:
+            logger.debug("Using cached Sonos discovery (%s speakers)", len(zones))
+            return list(zones)
+        in_flight = _DISCOVERY_IN_FLIGHT
+        leader = in_flight is None
+        if leader:
+            in_flight = _DISCOVERY_IN_FLIGHT = threading.Event()
+    if not leader:
+        logger.debug("Sonos discovery already in progress; waiting for its result")
+        in_flight.wait(timeout=SONOS_DISCOVERY_WAIT)
+        with _SPEAKER_CACHE_LOCK:
+            return list(_SPEAKER_CACHE["zones"])
+    zones = []
+    try:
+        with _SPEAKER_CACHE_LOCK:
+            known = list(_SPEAKER_CACHE["zones"])
+        # On a cold start, seed the topology lookup from the addresses saved last run
+        zones = _zones_from_topology(known or _load_zone_addresses()) or _discover_sonos_speakers()
+        # Failed discoveries are not cached so the next request retries
+        if zones:
+            _save_zone_addresses(zones)
+            ips = _topology_ips(zones)
+            with _SPEAKER_CACHE_LOCK:
+                _SPEAKER_CACHE["zones"] = zones
+                _SPEAKER_CACHE["ips"] = ips
+                _SPEAKER_CACHE["ts"] = time.monotonic()
+    finally:
+        with _SPEAKER_CACHE_LOCK:
+            _DISCOVERY_IN_FLIGHT = None
+        in_flight.set()
+    return list(zones)
+
+def invalidate_sonos_cache():
+    """Expire the cached discovery so the next lookup re-discovers (e.g. after a speaker stops responding)."""
+    with _SPEAKER_CACHE_LOCK:
+        _SPEAKER_CACHE["ts"] = 0.0
+
+def _zones_from_topology(known):
+    """Refresh the zone list from the group topology of an already-known speaker (no SSDP).
+
+    Only visible zones are returned, matching soco.discover(): bonded satellites (surrounds,
+    subs) show up in all_zones but do not answer AVTransport calls reliably.
+    Returns [] if no known speaker answers, so the caller falls back to discovery.
+    """
+    if soco is None:
+        return []
+    soco.config.REQUEST_TIMEOUT = SONOS_REQUEST_TIMEOUT
+    for speaker in known[:2]:
+        try:
+            zones = list(speaker.visible_zones)
+            if zones:
+                logger.debug("Refreshed %s Sonos speakers from %s's topology", len(zones), speaker.ip_address)
+                return zones
+        except Exception as e:
+            logger.debug("Topology refresh via %s failed: %s", speaker.ip_address, e)
+    return []
+
+def _topology_ips(zones):
+    """Return the IPs of every player in the zones' household, including the bonded satellites
+    and Boost/Bridge units that are left out of the visible zone list."""
+    ips = {z.ip_address for z in zones}
+    try:
+        # Same ZoneGroupState as visible_zones, which SoCo has just cached
+        ips.update(z.ip_address for z in zones[0].all_zones)
+    except Exception as e:
+        logger.debug("Reading all_zones via %s failed: %s", zones[0].ip_address, e)
+    return frozenset(ips)
+
+def _discover_sonos_speakers():
     """Discover and return Sonos speakers."""
     logger.info("Starting Sonos speaker discovery")
-    try:
-        import soco
-    except ImportError:
+    if soco is None:
         logger.error("SoCo library not found.")
         return []
+    soco.config.REQUEST_TIMEOUT = SONOS_REQUEST_TIMEOUT
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            logger.debug(f"Discovery attempt {attempt+1}/{max_retries}")
+            logger.debug("Discovery attempt %s/%s", attempt+1, max_retries)
             zones = list(soco.discover(timeout=5) or [])
             if zones:
-                logger.info(f"Discovered {len(zones)} Sonos speakers: {[z.player_name for z in zones]}")
+                logger.info("Discovered %s Sonos speakers: %s", len(zones), [z.player_name for z in zones])
                 return zones
             else:
-                logger.warning(f"No Sonos speakers found (attempt {attempt+1}/{max_retries})")
+                logger.warning("No Sonos speakers found (attempt %s/%s)", attempt+1, max_retries)
         except Exception as e:
-            logger.error(f"Error during Sonos discovery (attempt {attempt+1}): {e}")
+            logger.error("Error during Sonos discovery (attempt %s): %s", attempt+1, e)
     logger.error("Failed to discover any Sonos speakers after all retries")
     return []
 
+ZONE_ADDRESSES_PATH = os.path.join('logs', 'zones.json')
+_SAVED_ZONE_ADDRESSES = None
+
+def _load_zone_addresses():
+    """Return SoCo objects for the speaker IPs saved by a previous run ([] if none)."""
+    global _SAVED_ZONE_ADDRESSES
+    if soco is None:
+        return []
+    try:
+        with open(ZONE_ADDRESSES_PATH, 'r') as f:
+            _SAVED_ZONE_ADDRESSES = _json_loads(f.read())
+    except Exception:
+        return []
+    return [soco.SoCo(ip) for ip in _SAVED_ZONE_ADDRESSES.values()]
+
+def _zone_addresses_lock():
+    f = open(ZONE_ADDRESSES_PATH + '.lock', 'a')
+    fcntl.flock(f, fcntl.LOCK_EX)
+    return f
+
+def _save_zone_addresses(zones):
+    """Persist `{player_name: ip}` for the next cold start; skipped when already saved.
+
+    Every gunicorn worker saves its own view, so the file is re-read and merged under an flock:
+    current speakers come first, and saved ones whose name and IP are both unclaimed are kept.
+    """
+    global _SAVED_ZONE_ADDRESSES
+    try:
+        addresses = {z.player_name: z.ip_address for z in zones}
+        if _SAVED_ZONE_ADDRESSES is not None and addresses.items() <= _SAVED_ZONE_ADDRESSES.items():
+            return
+        os.makedirs(os.path.dirname(ZONE_ADDRESSES_PATH), exist_ok=True)
+        lock = _zone_addresses_lock()
+        try:
+            try:
+                with open(ZONE_ADDRESSES_PATH, 'r') as f:
+                    saved = _json_loads(f.read())
+            except Exception:
+                saved = {}
+            if addresses.items() <= saved.items():
+                _SAVED_ZONE_ADDRESSES = saved
+                return
+            ips = set(addresses.values())
+            merged = dict(addresses)
+            merged.update((name, ip) for name, ip in saved.items() if name not in merged and ip not in ips)
+            tmp = f"{ZONE_ADDRESSES_PATH}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as f:
+                f.write(_json_dumps(merged))
+            os.replace(tmp, ZONE_ADDRESSES_PATH)
+            _SAVED_ZONE_ADDRESSES = merged
+        finally:
+            lock.close()
+    except Exception as e:
+        logger.warning(f"Failed to persist Sonos zone addresses: {e}")
+
+SSDP_GROUP = '239.255.255.250'
+SSDP_PORT = 1900
+
+def _ssdp_listener():
+    """Passively watch SSDP NOTIFYs from Sonos ZonePlayers and expire the speaker cache when
+    a speaker we do not know announces itself or a known one says byebye."""
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        # Share port 1900 with any other SSDP listener on the host
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(('', SSDP_PORT))
+        mreq = struct.pack('4sl', socket.inet_aton(SSDP_GROUP), socket.INADDR_ANY)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+    except OSError as e:
+        logger.warning("SSDP listener unavailable (%s); relying on periodic refresh only", e)
+        return
+    logger.info("Listening for Sonos SSDP announcements")
+    while True:
+        try:
+            data, (ip, _) = sock.recvfrom(4096)
+        except OSError as e:
+            logger.warning("SSDP listener stopped: %s", e)
+            return
+        if not data.startswith(b'NOTIFY') or b'ZonePlayer' not in data:
+            continue
+        byebye = b'ssdp:byebye' in data
+        with _SPEAKER_CACHE_LOCK:
+            known = ip in _SPEAKER_CACHE["ips"]
+        if byebye == known:
+            logger.debug("SSDP %s from %s; expiring speaker cache", 'byebye' if byebye else 'alive', ip)
+            invalidate_sonos_cache()
+
+def warmup_sonos():
+    """Prime the local IP and speaker list in the background, then keep the speaker cache
+    fresh every SONOS_CACHE_TTL/2 so request handlers never wait on a refresh."""
+    threading.Thread(target=_ssdp_listener, name='ssdp-listener', daemon=True).start()
+
+    def _warmup():
+        get_local_ip()
+        get_sonos_speakers()
+        while True:
+            time.sleep(SONOS_CACHE_TTL / 2)
+            try:
+                get_sonos_speakers(force_refresh=True)
+            except Exception as e:
+                logger.warning("Background Sonos refresh failed: %s", e)
+    threading.Thread(target=_warmup, name='sonos-warmup', daemon=True).start()
+
 # ---------------------------------------------------------
 # Routes
 # ---------------------------------------------------------
+STATIC_MAX_AGE = 3600  # assets may be cached for an hour; HTML is always revalidated via its ETag
+# Only frontend assets are servable: dotfiles, backend/tooling directories and every other
+# extension (.py, .env, .txt, .bak, ...) stay private.
+STATIC_EXTENSIONS = frozenset({'.html', '.js', '.mjs', '.css', '.ts', '.tsx', '.map',
+                               '.svg', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico',
+                               '.woff', '.woff2', '.ttf'})
+STATIC_SKIP_DIRS = frozenset({'node_modules', '__pycache__', 'logs', 'scripts', 'audio'})
+STATIC_SKIP_FILES = frozenset({'vite.config.ts'})
+
+def _is_static_asset(rel_path):
+    """True if the `/`-separated path relative to the app root may be served as a frontend asset."""
+    parts = rel_path.split('/')
+    if any(not p or p.startswith('.') or p in STATIC_SKIP_DIRS for p in parts[:-1]):
+        return False
+    name = parts[-1]
+    return (not name.startswith('.') and rel_path not in STATIC_SKIP_FILES
+            and os.path.splitext(name)[1].lower() in STATIC_EXTENSIONS)
+
+def _index_static_files():
+    """Map every servable `relative/path` to its absolute path, walked once at startup."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.') and d not in STATIC_SKIP_DIRS]
+        for name in filenames:
+            full = os.path.join(dirpath, name)
+            rel = os.path.relpath(full, root).replace(os.sep, '/')
+            if _is_static_asset(rel):
+                files[rel] = full
+    return files
+
+_STATIC_FILES = _index_static_files()
+
 @app.route('/')
 def serve_index():
-    return send_from_directory('.', 'index.html')
+    return send_from_directory('.', 'index.html', conditional=True, etag=True)
 
 @app.route('/<path:path>')
 def serve_static(path):
-    return send_from_directory('.', path)
+    max_age = None if path.endswith('.html') else STATIC_MAX_AGE
+    full = _STATIC_FILES.get(path)
+    if full is not None:
+        return send_file(full, conditional=True, etag=True, max_age=max_age)
+    if not _is_static_asset(path):
+        abort(404)
+    # Asset added or rebuilt after startup: look it up on disk (404s if it does not exist)
+    return send_from_directory('.', path, conditional=True, etag=True, max_age=max_age)
+
+def _load_audio_cache():
+    """Read the deployed MP3s into memory once so speaker fetches never touch the SD card.
+
+    Returns `{filename: (bytes, etag)}`; the ETag is computed here rather than per request.
+    """
+    cache = {}
+    audio_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'audio')
+    try:
+        for name in os.listdir(audio_dir):
+            if name.endswith('.mp3'):
+                with open(os.path.join(audio_dir, name), 'rb') as f:
+                    buf = f.read()
+                cache[name] = (buf, hashlib.sha1(buf).hexdigest())
+    except Exception as e:
+        logger.warning(f"Failed to preload audio files: {e}")
+    return cache
+
+_AUDIO_CACHE = _load_audio_cache()
+
+def _load_audio_durations():
+    """Return `{filename: seconds}` for audio/*.mp3, read from the MP3 headers (empty without mutagen)."""
+    durations = {}
+    if MP3 is None:
+        return durations
+    audio_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'audio')
+    try:
+        names = [n for n in os.listdir(audio_dir) if n.endswith('.mp3')]
+    except OSError:
+        return durations
+    for name in names:
+        try:
+            durations[name] = MP3(os.path.join(audio_dir, name)).info.length
+        except Exception as e:
+            logger.warning(f"Failed to read duration of {name}: {e}")
+    return durations
+
+AUDIO_DURATIONS = _load_audio_durations()
+
+@app.route('/audio/<path:filename>')
+def serve_audio(filename):
+    """Serve Azan audio to the speakers with Range/conditional support.
+
+    Preloaded files are answered from memory; anything else falls back to disk, where
+    under gunicorn the body goes through `wsgi.file_wrapper` (sendfile(2)).
+    """
+    cached = _AUDIO_CACHE.get(filename)
+    if cached is None:
+        resp = send_from_directory('audio', filename, conditional=True, etag=True, max_age=3600)
+    else:
+        buf, etag = cached
+        resp = Response(buf, mimetype='audio/mpeg')
+        resp.set_etag(etag)
+        resp.cache_control.max_age = 3600
+        resp.make_conditional(request, accept_ranges=True, complete_length=len(buf))
+    resp.headers['Accept-Ranges'] = 'bytes'
+    resp.cache_control.public = True
+    return resp
+
+# uids of zones that failed their last /api/zones poll; only a zone's first failure expires
+# the speaker cache, so an unplugged speaker does not force a refresh on every poll
+_OFFLINE_ZONE_UIDS = set()
 
 @app.route('/api/zones', methods=['GET'])
 def list_zones():
     """Return list of available zones and their status."""
-    logger.info("API /api/zones requested")
+    # The UI polls this endpoint; keep per-request lines at DEBUG
+    logger.debug("API /api/zones requested")
     try:
         speakers = get_sonos_speakers()
-        found_names = [s.player_name for s in speakers]
+        found_names = {s.player_name for s in speakers}
         data = []
-        # Add discovered zones that match static names
-        for s in speakers:
-            if s.player_name in STATIC_ZONE_NAMES:
-                status = 'idle'
-                try:
-                    info = s.get_current_transport_info()
-                    if info['current_transport_state'] == 'PLAYING':
-                        status = 'playing_music'
-                except Exception as e:
-                    logger.warning(f"Failed to get transport info for {s.player_name}: {e}")
+
+        # Add discovered zones that match static names. Transport state and volume are
+        # separate SOAP calls, so both are issued at once for every zone.
+        matching = [s for s in speakers if s.player_name in STATIC_ZONE_NAMES]
+        pending = [(s, SONOS_EXECUTOR.submit(s.get_current_transport_info), SONOS_EXECUTOR.submit(getattr, s, 'volume'))
+                   for s in matching]
+        deadline = time.monotonic() + SONOS_FANOUT_TIMEOUT
+        for s, info_fut, volume_fut in pending:
+            try:
+                volume = volume_fut.result(timeout=max(0.0, deadline - time.monotonic()))
+            except Exception as err:
+                if s.uid not in _OFFLINE_ZONE_UIDS:
+                    _OFFLINE_ZONE_UIDS.add(s.uid)
+                    logger.warning("Zone %s did not respond: %r; reporting offline", s.player_name, err)
+                    invalidate_sonos_cache()
                 data.append({
                     "id": s.uid,
                     "name": s.player_name,
-                    "isAvailable": True,
-                    "status": status,
-                    "volume": s.volume
+                    "isAvailable": False,
+                    "status": "offline",
+                    "volume": 0
                 })
+                continue
+            _OFFLINE_ZONE_UIDS.discard(s.uid)
+            status = 'idle'
+            try:
+                info = info_fut.result(timeout=max(0.0, deadline - time.monotonic()))
+                if info['current_transport_state'] == 'PLAYING':
+                    status = 'playing_music'
+            except Exception as e:
+                logger.warning("Failed to get transport info for %s: %s", s.player_name, e)
+            data.append({
+                "id": s.uid,
+                "name": s.player_name,
+                "isAvailable": True,
+                "status": status,
+                "volume": volume
+            })
         # Add static zones not found in discovery as offline
-        for name in STATIC_ZONE_NAMES:
+        for name in STATIC_ZONE_ORDER:
             if name not in found_names:
                 data.append({
                     "id": name,
@@ -167,13 +778,187 @@ def list_zones():
                     "status": "offline",
                     "volume": 0
                 })
-        logger.info(f"API /api/zones returning {len(data)} zones")
+        logger.debug("API /api/zones returning %s zones", len(data))
         return jsonify(data)
     except Exception as e:
-        logger.error(f"API /api/zones error: {e}")
+        logger.error("API /api/zones error: %s", e)
         return jsonify([]), 500
 
 
+@app.route('/api/zones/refresh', methods=['POST'])
+def refresh_zones():
+    """Force a fresh Sonos discovery (and local IP detection), then return the zone list."""
+    invalidate_local_ip()
+    get_sonos_speakers(force_refresh=True)
+    return list_zones()
+
+
+class NodePrayerWorker:
+    """Long-lived `compute_prayer_times.mjs --server` process (one JSON line in, one out).
+
+    Avoids a Node cold start per computation. The process is started lazily, restarted
+    if it exits, hangs past `timeout`, or was inherited across a fork.
+    """
+    def __init__(self, script, timeout=5.0):
+        self._script = script
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._proc = None
+        self._owner_pid = None
+
+    def _ensure_started(self):
+        if self._proc is not None and self._proc.poll() is None and self._owner_pid == os.getpid():
+            return
+        if not os.path.exists(self._script):
+            raise FileNotFoundError(self._script)
+        self._proc = Popen(['node', self._script, '--server'], stdin=PIPE, stdout=PIPE, text=True, bufsize=1)
+        self._owner_pid = os.getpid()
+
+    def _stop(self):
+        proc, self._proc = self._proc, None
+        if proc is not None and self._owner_pid == os.getpid():
+            try:
+                proc.kill()
+                proc.wait(timeout=1)
+            except Exception:
+                pass
+
+    def compute(self, date_str=None):
+        """Return the helper's JSON result for `date_str` (YYYY-MM-DD, or today if None)."""
+        with self._lock:
+            self._ensure_started()
+            try:
+                self._proc.stdin.write(_json_dumps({'date': date_str}) + '\n')
+                self._proc.stdin.flush()
+                ready, _, _ = select.select([self._proc.stdout], [], [], self._timeout)
+                if not ready:
+                    raise TimeoutError(f"node helper did not answer within {self._timeout}s")
+                line = self._proc.stdout.readline()
+                if not line:
+                    raise RuntimeError(f"node helper exited (rc={self._proc.poll()})")
+            except Exception:
+                self._stop()
+                raise
+        data = _json_loads(line)
+        if 'error' in data:
+            raise RuntimeError(f"node helper error: {data['error']}")
+        return data
+
+NODE_PRAYER_WORKER = NodePrayerWorker(os.path.join(os.path.dirname(__file__), 'scripts', 'compute_prayer_times.mjs'))
+
+
+# Prayer times are a pure function of (date, lat, lon, tz), so results are memoized and
+# persisted across restarts. Keys are "YYYY-MM-DD|lat|lon|tz"; only the newest entries are kept.
+PRAYER_TIMES_CACHE_PATH = os.path.join('logs', 'prayer_times_cache.json')
+PRAYER_TIMES_CACHE_MAX = 64
+_PRAYER_TIMES_CACHE = None
+_PRAYER_TIMES_CACHE_LOCK = threading.Lock()
+
+def _load_prayer_times_cache():
+    global _PRAYER_TIMES_CACHE
+    if _PRAYER_TIMES_CACHE is None:
+        try:
+            with open(PRAYER_TIMES_CACHE_PATH, 'r') as f:
+                _PRAYER_TIMES_CACHE = _json_loads(f.read())
+        except Exception:
+            _PRAYER_TIMES_CACHE = {}
+    return _PRAYER_TIMES_CACHE
+
+def _prayer_times_cache_lock():
+    f = open(PRAYER_TIMES_CACHE_PATH + '.lock', 'a')
+    fcntl.flock(f, fcntl.LOCK_EX)
+    return f
+
+def _save_prayer_times_cache(key, times):
+    """Add `key` to the cache and persist it.
+
+    Every gunicorn worker has its own in-memory copy, so the file is re-read and merged under
+    an flock instead of being overwritten with this process's view.
+    """
+    global _PRAYER_TIMES_CACHE
+    cache = dict(_load_prayer_times_cache())
+    lock = None
+    try:
+        os.makedirs(os.path.dirname(PRAYER_TIMES_CACHE_PATH), exist_ok=True)
+        lock = _prayer_times_cache_lock()
+        try:
+            with open(PRAYER_TIMES_CACHE_PATH, 'r') as f:
+                cache = _json_loads(f.read())
+        except Exception:
+            pass
+        cache[key] = times
+        # dicts keep insertion order; drop the oldest entries beyond the cap
+        for old_key in list(cache)[:-PRAYER_TIMES_CACHE_MAX]:
+            del cache[old_key]
+        tmp = f"{PRAYER_TIMES_CACHE_PATH}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(_json_dumps(cache))
+        os.replace(tmp, PRAYER_TIMES_CACHE_PATH)
+    except Exception as e:
+        cache[key] = times
+        logger.warning(f"Failed to persist prayer times cache: {e}")
+    finally:
+        if lock is not None:
+            lock.close()
+    _PRAYER_TIMES_CACHE = cache
+
+def _compute_prayer_times(target_date, lat, lon, tz):
+    """Compute prayer times, preferring the Node `adhan` helper for parity with the frontend
+    and falling back to Python `praytimes` if Node/adhan is not available.
+
+    Returns `(times, from_node)`; `from_node` is False for the `praytimes` fallback.
+    """
+    try:
+        node_data = NODE_PRAYER_WORKER.compute(target_date.isoformat())
+        return {
+            'date': target_date.isoformat(),
+            'fajr': node_data.get('fajr'),
+            'sunrise': node_data.get('sunrise'),
+            'dhuhr': node_data.get('dhuhr'),
+            'asr': node_data.get('asr'),
+            'maghrib': node_data.get('maghrib'),
+            'isha': node_data.get('isha')
+        }, True
+    except Exception as e:
+        logger.warning(f"Failed to run node helper for prayertimes: {e}")
+    pt = praytimes.PrayTimes()
+    # praytimes expects a (year, month, day) tuple and a timezone offset in hours.
+    # Compute the local timezone offset for the target date (may include DST)
+    try:
+        local_dt = datetime(target_date.year, target_date.month, target_date.day, tzinfo=tz)
+        offset_td = local_dt.utcoffset() or timedelta(0)
+        tz_offset_hours = offset_td.total_seconds() / 3600.0
+    except Exception:
+        tz_offset_hours = 0
+    # Pass the computed offset so returned times are in local time
+    times = pt.getTimes((target_date.year, target_date.month, target_date.day), (lat, lon), tz_offset_hours)
+    return {'date': target_date.isoformat(), 'fajr': times.get('fajr'), 'sunrise': times.get('sunrise'), 'dhuhr': times.get('dhuhr'), 'asr': times.get('asr'), 'maghrib': times.get('maghrib'), 'isha': times.get('isha')}, False
+
+@functools.lru_cache(maxsize=1)
+def get_prayer_tz():
+    """Local timezone used for prayer scheduling, resolved once per process."""
+    return get_localzone()
+
+def get_prayer_times(target_date):
+    """Return `{'date', 'fajr', 'sunrise', 'dhuhr', 'asr', 'maghrib', 'isha'}` (HH:MM strings) for `target_date`."""
+    # Get coordinates from environment variables if provided, else default to Dubai
+    lat = float(os.environ.get('PRAYER_LAT', '25.2048'))
+    lon = float(os.environ.get('PRAYER_LON', '55.2708'))
+    tz = get_prayer_tz() if SCHEDULER_AVAILABLE else None
+    key = f"{target_date.isoformat()}|{lat:.4f}|{lon:.4f}|{tz}"
+    with _PRAYER_TIMES_CACHE_LOCK:
+        cached = _load_prayer_times_cache().get(key)
+    if cached is not None:
+        return dict(cached)
+    times, from_node = _compute_prayer_times(target_date, lat, lon, tz)
+    if not from_node:
+        # praytimes uses a different method than the frontend; recompute once Node is back
+        return dict(times)
+    with _PRAYER_TIMES_CACHE_LOCK:
+        _save_prayer_times_cache(key, times)
+    return dict(times)
+
+
 @app.route('/api/prayertimes', methods=['GET'])
 def api_prayer_times():
     """Return prayer times for a given date (query param `date=YYYY-MM-DD`).
@@ -181,47 +966,16 @@ def api_prayer_times():
     Falls back to Python `praytimes` if Node/adhan is not available.
     """
     date_q = request.args.get('date')
-    # Try Node helper first
-    try:
-        script = os.path.join(os.path.dirname(__file__), 'scripts', 'compute_prayer_times.mjs')
-        if os.path.exists(script):
-            cmd = ['node', script]
-            if date_q:
-                cmd.append(date_q)
-            p = Popen(cmd, stdout=PIPE, stderr=PIPE, text=True)
-            out, err = p.communicate(timeout=5)
-            if p.returncode == 0 and out:
-                try:
-                    return jsonify(json.loads(out))
-                except Exception:
-                    logger.warning(f"Node helper returned invalid JSON: {out}")
-            else:
-                logger.warning(f"Node helper failed: rc={p.returncode} err={err}")
-    except Exception as e:
-        logger.warning(f"Failed to run node helper for prayertimes: {e}")
-
-    # Fallback to existing praytimes calculation
-    try:
-        tgt = date.today()
-        if date_q:
-            try:
-                tgt = datetime.fromisoformat(date_q).date()
-            except Exception:
-                pass
-        lat = float(os.environ.get('PRAYER_LAT', '25.2048'))
-        lon = float(os.environ.get('PRAYER_LON', '55.2708'))
-        tz = get_localzone()
-        pt = praytimes.PrayTimes()
+    tgt = date.today()
+    if date_q:
         try:
-            local_dt = datetime(tgt.year, tgt.month, tgt.day, tzinfo=tz)
-            offset_td = local_dt.utcoffset() or timedelta(0)
-            tz_offset_hours = offset_td.total_seconds() / 3600.0
+            tgt = datetime.fromisoformat(date_q).date()
         except Exception:
-            tz_offset_hours = 0
-        times = pt.getTimes((tgt.year, tgt.month, tgt.day), (lat, lon), tz_offset_hours)
-        return jsonify({'date': tgt.isoformat(), 'fajr': times.get('fajr'), 'sunrise': times.get('sunrise'), 'dhuhr': times.get('dhuhr'), 'asr': times.get('asr'), 'maghrib': times.get('maghrib'), 'isha': times.get('isha')})
+            pass
+    try:
+        return jsonify(get_prayer_times(tgt))
     except Exception as e:
-        logger.error(f"Failed to compute prayertimes fallback: {e}")
+        logger.error(f"Failed to compute prayertimes: {e}")
         return jsonify({'error': str(e)}), 500
 
 
@@ -229,47 +983,186 @@ def api_prayer_times():
 # Scheduler helpers (optional)
 # ---------------------------------------------------------
 scheduler = None
-# Track missed-scheduler attempts per date so we can adapt retry cadence.
-MISSED_SCHED_ATTEMPTS = {}
-
-def _http_post_play(filename):
-    """POST to the local /api/play endpoint to trigger playback."""
-    try:
-        import urllib.request
-        body = json.dumps({"file": filename}).encode('utf-8')
-        req = urllib.request.Request('http://127.0.0.1:5000/api/play', data=body, headers={'Content-Type': 'application/json'})
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            resp_body = resp.read().decode('utf-8')
-            logger.info(f"Scheduled play triggered for {filename}: {resp.status} {resp_body}")
+# Jobs are rebuilt from prayer times on every start, so the in-memory store is the default;
+# BILAL_PERSIST_JOBS=1 (PERSIST_JOBS) keeps them in SQLite instead.
+SCHEDULER_DB_URL = 'sqlite:///' + os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'scheduler.sqlite')
+
+def _scheduler_db_engine():
+    """SQLite engine for the job store in WAL mode with NORMAL sync: job adds/removes then cost
+    an append to the WAL instead of a rollback-journal rewrite plus fsyncs per statement."""
+    engine = create_engine(SCHEDULER_DB_URL)
+
+    @sa_event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        cur.execute('PRAGMA journal_mode=WAL')
+        cur.execute('PRAGMA synchronous=NORMAL')
+        cur.close()
+    return engine
+
+def _create_scheduler():
+    """Build the BackgroundScheduler. Jobs live in memory (dict lookups, no DB round-trips)
+    unless PERSIST_JOBS is set and SQLAlchemy is available."""
+    kwargs = {'timezone': get_prayer_tz()}
+    if PERSIST_JOBS and SQLAlchemyJobStore is not None:
+        try:
+            kwargs['jobstores'] = {'default': SQLAlchemyJobStore(engine=_scheduler_db_engine())}
+        except Exception as e:
+            logger.warning(f"Persistent job store unavailable ({e}); using in-memory jobs")
+    return BackgroundScheduler(**kwargs)
+
+
+# If today's prayer times cannot be computed at all, retry once after this delay.
+MISSED_SCHED_RETRY = timedelta(hours=1)
+
+# Play history is an append-only JSON-lines file: one `{"file", "ts"}` object per line.
+# Writers serialize on a separate lock file (compaction replaces the history file itself).
+PLAY_HISTORY_PATH = os.path.join('logs', 'play_history.jsonl')
+_LEGACY_PLAY_HISTORY_PATH = os.path.join('logs', 'play_history.json')
+PLAY_HISTORY_KEEP = 100
+PLAY_HISTORY_COMPACT_BYTES = 64 * 1024
+_PLAY_HISTORY_TAIL_BYTES = 16 * 1024
+# Parsed tail of the history, reused while the file's (size, mtime) is unchanged
+_PLAY_HISTORY_CACHE = {'stamp': None, 'entries': []}
+_PLAY_HISTORY_CACHE_LOCK = threading.Lock()
+# Appends from the play path run here so the flock, write and any compaction stay off the
+# request thread; one worker keeps entries in order. Shutdown waits so nothing is dropped.
+PLAY_HISTORY_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix='play-history')
+atexit.register(PLAY_HISTORY_POOL.shutdown)
+
+def _play_history_lock():
+    f = open(PLAY_HISTORY_PATH + '.lock', 'a')
+    fcntl.flock(f, fcntl.LOCK_EX)
+    return f
+
+def _migrate_legacy_play_history():
+    """One-time conversion of the old whole-file JSON array into JSON lines."""
+    if os.path.exists(PLAY_HISTORY_PATH) or not os.path.exists(_LEGACY_PLAY_HISTORY_PATH):
+        return
+    try:
+        with open(_LEGACY_PLAY_HISTORY_PATH, 'r') as f:
+            legacy = _json_loads(f.read())
+        with open(PLAY_HISTORY_PATH, 'a') as f:
+            for entry in legacy[-PLAY_HISTORY_KEEP:]:
+                f.write(_json_dumps(entry) + '\n')
+        os.rename(_LEGACY_PLAY_HISTORY_PATH, _LEGACY_PLAY_HISTORY_PATH + '.migrated')
     except Exception as e:
-        logger.error(f"Scheduled play POST failed for {filename}: {e}")
+        logger.warning(f"Failed to migrate legacy play history: {e}")
+
+def _tail_history(n=PLAY_HISTORY_KEEP):
+    """Return up to the last `n` play-history entries (oldest first), reading only the file tail."""
+    if not os.path.exists(PLAY_HISTORY_PATH) and os.path.exists(_LEGACY_PLAY_HISTORY_PATH):
+        lock = _play_history_lock()
+        try:
+            _migrate_legacy_play_history()
+        finally:
+            lock.close()
+    try:
+        st = os.stat(PLAY_HISTORY_PATH)
+    except FileNotFoundError:
+        return []
+    stamp = (st.st_size, st.st_mtime_ns)
+    with _PLAY_HISTORY_CACHE_LOCK:
+        if _PLAY_HISTORY_CACHE['stamp'] != stamp:
+            with open(PLAY_HISTORY_PATH, 'rb') as f:
+                f.seek(max(0, st.st_size - _PLAY_HISTORY_TAIL_BYTES), os.SEEK_SET)
+                chunk = f.read()
+            lines = chunk.splitlines()
+            if st.st_size > _PLAY_HISTORY_TAIL_BYTES:
+                lines = lines[1:]  # first line may be partial
+            entries = []
+            for line in reversed(lines):
+                if len(entries) >= PLAY_HISTORY_KEEP:
+                    break
+                try:
+                    entries.append(_json_loads(line))
+                except Exception:
+                    continue
+            entries.reverse()
+            _PLAY_HISTORY_CACHE['stamp'] = stamp
+            _PLAY_HISTORY_CACHE['entries'] = entries
+        entries = _PLAY_HISTORY_CACHE['entries']
+    return list(entries[-n:]) if n else []
 
+def _compact_play_history():
+    """Rewrite the history file down to its last PLAY_HISTORY_KEEP entries (caller holds the lock)."""
+    entries = _tail_history(PLAY_HISTORY_KEEP)
+    tmp = PLAY_HISTORY_PATH + '.tmp'
+    with open(tmp, 'w') as f:
+        for entry in entries:
+            f.write(_json_dumps(entry) + '\n')
+    os.replace(tmp, PLAY_HISTORY_PATH)
 
 def _append_play_history(filename, when=None):
-    """Append a successful play event to `logs/play_history.json` for later scheduling decisions."""
+    """Append a successful play event to `logs/play_history.jsonl` for later scheduling decisions."""
     try:
         os.makedirs('logs', exist_ok=True)
-        path = os.path.join('logs', 'play_history.json')
+        when = when or datetime.now().astimezone()
         entry = {
             'file': filename,
-            'ts': (when or datetime.now()).isoformat()
+            'ts': when.isoformat(),
+            'ts_epoch': int(when.timestamp())
         }
-        # Load existing
-        data = []
+        lock = _play_history_lock()
         try:
-            with open(path, 'r') as f:
-                data = json.load(f)
-        except Exception:
-            data = []
-        data.append(entry)
-        # Keep only recent entries (e.g., last 100)
-        data = data[-100:]
-        with open(path, 'w') as f:
-            json.dump(data, f)
+            _migrate_legacy_play_history()
+            with open(PLAY_HISTORY_PATH, 'a') as f:
+                f.write(_json_dumps(entry) + '\n')
+                size = f.tell()
+            # Compact once the file has grown well past the retained window
+            if size > PLAY_HISTORY_COMPACT_BYTES:
+                _compact_play_history()
+        finally:
+            lock.close()
     except Exception as e:
         logger.warning(f"Failed to append play history: {e}")
 
 
+def _index_play_history(play_history, tz):
+    """Index history once into `{'fajr.mp3'|'azan.mp3': sorted epoch seconds}` for bisect lookups.
+
+    Uses the stored `ts_epoch` field; legacy rows without it fall back to parsing `ts`.
+    """
+    played_ts = {'fajr.mp3': [], 'azan.mp3': []}
+    for entry in play_history:
+        try:
+            f = entry.get('file') or ''
+            fname = 'fajr.mp3' if 'fajr.mp3' in f else 'azan.mp3' if 'azan.mp3' in f else None
+            if fname is None:
+                continue
+            epoch = entry.get('ts_epoch')
+            if epoch is None:
+                p_ts = datetime.fromisoformat(entry.get('ts'))
+                # Normalize timezone if naive
+                if p_ts.tzinfo is None:
+                    p_ts = p_ts.replace(tzinfo=tz)
+                epoch = p_ts.timestamp()
+            played_ts[fname].append(epoch)
+        except Exception:
+            continue
+    for stamps in played_ts.values():
+        stamps.sort()
+    return played_ts
+
+
+def _prayer_datetimes(target_date, tz):
+    """Return `{prayer: tz-aware datetime}` for the five Azan prayers on `target_date`.
+
+    Prayers without a time are left out. Raises if prayer times cannot be computed.
+    """
+    times = get_prayer_times(target_date)
+    # Tz-aware local midnight; each prayer is an offset from it
+    base = datetime(target_date.year, target_date.month, target_date.day, tzinfo=tz)
+    prayers = {}
+    for key in ('fajr', 'dhuhr', 'asr', 'maghrib', 'isha'):
+        tstr = times.get(key)
+        if not tstr:
+            continue
+        hour, minute = map(int, tstr.split(':')[:2])
+        prayers[key] = base + timedelta(hours=hour, minutes=minute)
+    return prayers
+
+
 def schedule_prayers_for_date(target_date: date):
     """Compute prayer times for `target_date` and schedule Azan jobs.
 
@@ -282,191 +1175,114 @@ def schedule_prayers_for_date(target_date: date):
 
     scheduled_count = 0
     try:
-        # Get coordinates from environment variables if provided, else default to Dubai
-        lat = float(os.environ.get('PRAYER_LAT', '25.2048'))
-        lon = float(os.environ.get('PRAYER_LON', '55.2708'))
-        tz = get_localzone()
-        # Prefer computing times with the frontend `adhan` implementation via our Node helper
-        times = None
-        try:
-            script = os.path.join(os.path.dirname(__file__), 'scripts', 'compute_prayer_times.mjs')
-            if os.path.exists(script):
-                cmd = ['node', script, target_date.isoformat()]
-                p = Popen(cmd, stdout=PIPE, stderr=PIPE, text=True)
-                out, err = p.communicate(timeout=5)
-                if p.returncode == 0 and out:
-                    try:
-                        node_data = json.loads(out)
-                        # node_data contains times as HH:MM strings; convert to same structure as praytimes.getTimes
-                        times = {
-                            'fajr': node_data.get('fajr'),
-                            'sunrise': node_data.get('sunrise'),
-                            'dhuhr': node_data.get('dhuhr'),
-                            'asr': node_data.get('asr'),
-                            'maghrib': node_data.get('maghrib'),
-                            'isha': node_data.get('isha')
-                        }
-                    except Exception:
-                        logger.warning(f"Node helper returned invalid JSON for prayertimes: {out}")
-                else:
-                    logger.warning(f"Node helper failed for prayertimes: rc={p.returncode} err={err}")
-        except Exception as e:
-            logger.warning(f"Failed to run node helper for prayer schedule: {e}")
-
-        # Fallback to Python praytimes if node helper did not produce times
-        if times is None:
-            pt = praytimes.PrayTimes()
-            # praytimes expects a (year, month, day) tuple and a timezone offset in hours.
-            # Compute the local timezone offset for the target date (may include DST)
-            try:
-                local_dt = datetime(target_date.year, target_date.month, target_date.day, tzinfo=tz)
-                offset_td = local_dt.utcoffset() or timedelta(0)
-                tz_offset_hours = offset_td.total_seconds() / 3600.0
-            except Exception:
-                tz_offset_hours = 0
-            # Pass the computed offset so returned times are in local time
-            times = pt.getTimes((target_date.year, target_date.month, target_date.day), (lat, lon), tz_offset_hours)
-        prayer_keys = ['fajr', 'dhuhr', 'asr', 'maghrib', 'isha']
+        tz = get_prayer_tz()
+        prayers = _prayer_datetimes(target_date, tz)
         # Load recent play history to avoid treating test runs (far from scheduled time) as on-time plays.
-        play_history = []
         try:
-            with open(os.path.join('logs', 'play_history.json'), 'r') as f:
-                play_history = json.load(f)
+            play_history = _tail_history()
         except Exception:
             play_history = []
-        for key in prayer_keys:
-            tstr = times.get(key)
-            if not tstr:
-                continue
-            parts = tstr.split(':')
-            hour = int(parts[0])
-            minute = int(parts[1])
-            # Create timezone-aware datetime using zoneinfo-compatible tz
-            scheduled_dt = datetime(target_date.year, target_date.month, target_date.day, hour, minute, tzinfo=tz)
-            now = datetime.now(tz)
+        played_ts = _index_play_history(play_history, tz)
+        # Allow overriding the play tolerance via environment variable
+        try:
+            tol = int(os.environ.get('PRAYER_PLAY_TOL_MIN', '5')) * 60
+        except Exception:
+            tol = 5 * 60
+        # One job-store read for the whole loop (get_jobs deserializes every stored job)
+        existing = {j.id for j in scheduler.get_jobs()}
+        now = datetime.now(tz)
+        for key, scheduled_dt in prayers.items():
             # Consider the prayer "served on time" only if a recorded play exists within
             # +/- tolerance minutes of the scheduled time. This prevents manual/test plays
             # outside the on-time window from affecting scheduling.
-            played_on_time = False
-            try:
-                # Allow overriding the play tolerance via environment variable
-                try:
-                    tol_minutes = int(os.environ.get('PRAYER_PLAY_TOL_MIN', '5'))
-                except Exception:
-                    tol_minutes = 5
-                for entry in play_history:
-                    try:
-                        p_ts = datetime.fromisoformat(entry.get('ts'))
-                        # Normalize timezone if naive
-                        if p_ts.tzinfo is None:
-                            p_ts = p_ts.replace(tzinfo=tz)
-                        delta = abs((p_ts - scheduled_dt).total_seconds())
-                        if delta <= tol_minutes * 60:
-                            # match by file name (fajr vs azan)
-                            fname = 'fajr.mp3' if key == 'fajr' else 'azan.mp3'
-                            if entry.get('file') and fname in entry.get('file'):
-                                played_on_time = True
-                                break
-                    except Exception:
-                        continue
-            except Exception:
-                played_on_time = False
+            # match by file name (fajr vs azan)
+            fname = 'fajr.mp3' if key == 'fajr' else 'azan.mp3'
+            stamps = played_ts.get(fname, [])
+            sched_epoch = scheduled_dt.timestamp()
+            i = bisect.bisect_left(stamps, sched_epoch - tol)
+            played_on_time = i < len(stamps) and stamps[i] <= sched_epoch + tol
 
             if scheduled_dt <= now and not played_on_time:
-                logger.debug(f"Skipping past prayer {key} at {scheduled_dt}")
+                logger.debug("Skipping past prayer %s at %s", key, scheduled_dt)
                 continue
             if played_on_time:
-                logger.info(f"Prayer {key} at {scheduled_dt} already played on time; skipping schedule")
+                logger.info("Prayer %s at %s already played on time; skipping schedule", key, scheduled_dt)
                 continue
             job_id = f"azan-{target_date.isoformat()}-{key}"
-            existing = [j.id for j in scheduler.get_jobs()]
             if job_id in existing:
-                logger.info(f"Job {job_id} already scheduled; skipping")
+                logger.info("Job %s already scheduled; skipping", job_id)
                 continue
-            logger.info(f"Scheduling {key} Azan at {scheduled_dt.isoformat()} (job id: {job_id})")
+            logger.info("Scheduling %s Azan at %s (job id: %s)", key, scheduled_dt.isoformat(), job_id)
             filename = 'fajr.mp3' if key == 'fajr' else 'azan.mp3'
-            scheduler.add_job(_http_post_play, trigger=DateTrigger(run_date=scheduled_dt), args=[filename], id=job_id)
+            scheduler.add_job(_scheduled_play, trigger=DateTrigger(run_date=scheduled_dt), args=[filename], id=job_id)
+            existing.add(job_id)
             scheduled_count += 1
     except Exception as e:
         logger.error(f"Failed to schedule prayers for {target_date}: {e}")
     return scheduled_count
+
+
+def _next_prayer_datetime(target_date, tz, after):
+    """Return the first Azan datetime on `target_date` later than `after`, or None if there is none.
+
+    Raises if prayer times cannot be computed.
+    """
+    upcoming = [dt for dt in _prayer_datetimes(target_date, tz).values() if dt > after]
+    return min(upcoming) if upcoming else None
+
+
 def schedule_today_and_rescheduler():
     """Schedule today's prayers and a daily rescheduler at 00:05 local time."""
     if not SCHEDULER_AVAILABLE:
         return
-    tz = get_localzone()
+    tz = get_prayer_tz()
     today = date.today()
 
     # Attempt to schedule today's prayers and record how many jobs were added.
     added = schedule_prayers_for_date(today)
 
-    # Helper to schedule the daily rescheduler (next day at 00:05)
-    def _schedule_daily_rescheduler():
-        try:
-            tomorrow = datetime.combine(today + timedelta(days=1), datetime.min.time()) + timedelta(minutes=5)
-            tomorrow = tomorrow.replace(tzinfo=tz)
-            def _resched():
-                schedule_prayers_for_date(date.today())
-            if 'rescheduler-daily' not in [j.id for j in scheduler.get_jobs()]:
-                scheduler.add_job(_resched, trigger=DateTrigger(run_date=tomorrow), id='rescheduler-daily')
-                logger.info(f"Scheduled daily rescheduler at {tomorrow}")
-        except Exception as e:
-            logger.warning(f"Failed to schedule daily rescheduler: {e}")
+    job_ids = {j.id for j in scheduler.get_jobs()}
+    # The daily rescheduler is a cron job so it keeps firing every night at 00:05.
+    try:
+        if 'rescheduler-daily' not in job_ids:
+            scheduler.add_job(schedule_today_and_rescheduler, trigger=CronTrigger(hour=0, minute=5, timezone=tz), id='rescheduler-daily')
+            logger.info("Scheduled daily rescheduler at 00:05")
+    except Exception as e:
+        logger.warning(f"Failed to schedule daily rescheduler: {e}")
 
-    # If nothing was scheduled for today (device may have been down at midnight),
-    # add a retry job that will attempt to schedule today's prayers until successful.
-    # Start with 5-minute retries for the first 6 attempts, then switch to hourly.
-    if added == 0:
+    if added > 0:
+        return
+    if any(jid.startswith(f"azan-{today.isoformat()}-") for jid in job_ids):
+        return
+    # Nothing new was scheduled and no Azan jobs are pending for today (device may have been
+    # down). Instead of polling, wake once: just before the next prayer if there is one today,
+    # or after MISSED_SCHED_RETRY if prayer times could not be computed. When every prayer
+    # has already passed the daily rescheduler covers tomorrow.
+    try:
+        now = datetime.now(tz)
         try:
-            def _try_schedule_missed():
-                try:
-                    key = date.today().isoformat()
-                    MISSED_SCHED_ATTEMPTS[key] = MISSED_SCHED_ATTEMPTS.get(key, 0) + 1
-                    attempts = MISSED_SCHED_ATTEMPTS[key]
-                    logger.info(f"Missed-scheduler attempt #{attempts} for {key}")
-                    cnt = schedule_prayers_for_date(date.today())
-                    if cnt > 0:
-                        logger.info(f"Missed-scheduler: scheduled {cnt} prayer jobs for today; removing retry job")
-                        try:
-                            scheduler.remove_job('missed-scheduler')
-                        except Exception:
-                            pass
-                        # After successfully scheduling today's jobs, ensure the daily rescheduler exists
-                        _schedule_daily_rescheduler()
-                        return
-                    # If we've tried 6 times at 5-minute intervals, switch to hourly retries
-                    if attempts >= 6:
-                        logger.info("Missed-scheduler reached 6 attempts; switching to hourly retries")
-                        try:
-                            scheduler.remove_job('missed-scheduler')
-                        except Exception:
-                            pass
-                        # Add a new job that runs hourly
-                        scheduler.add_job(_try_schedule_missed, trigger=IntervalTrigger(hours=1), id='missed-scheduler')
-                        return
-                    # Otherwise, continue retrying every 5 minutes (job remains)
-                except Exception as e:
-                    logger.warning(f"Missed-scheduler attempt failed: {e}")
-
-            if 'missed-scheduler' not in [j.id for j in scheduler.get_jobs()]:
-                scheduler.add_job(_try_schedule_missed, trigger=IntervalTrigger(minutes=5), id='missed-scheduler')
-                logger.info("Scheduled missed-scheduler job: 5-minute retries (first 6 attempts), then hourly")
+            next_dt = _next_prayer_datetime(today, tz, now + timedelta(minutes=1))
         except Exception as e:
-            logger.warning(f"Failed to schedule missed-scheduler: {e}")
-    else:
-        # If we scheduled jobs now, ensure the daily rescheduler is also scheduled
-        _schedule_daily_rescheduler()
+            logger.warning(f"Could not compute next prayer for missed-scheduler: {e}")
+            run_at = now + MISSED_SCHED_RETRY
+        else:
+            if next_dt is None:
+                logger.info("All of today's prayers have passed; waiting for the daily rescheduler")
+                return
+            run_at = next_dt - timedelta(minutes=1)
+        scheduler.add_job(schedule_today_and_rescheduler, trigger=DateTrigger(run_date=run_at), id='missed-scheduler', replace_existing=True)
+        logger.info(f"Scheduled one-shot missed-scheduler at {run_at}")
+    except Exception as e:
+        logger.warning(f"Failed to schedule missed-scheduler: {e}")
 
 
 @app.route('/api/scheduler/jobs', methods=['GET'])
 def list_scheduled_jobs():
     """Return a list of scheduled jobs (if scheduler is available)."""
     if not SCHEDULER_AVAILABLE or not scheduler:
-        return jsonify({'available': False, 'jobs': []})
-    jobs = []
-    for j in scheduler.get_jobs():
-        jobs.append({'id': j.id, 'next_run_time': str(j.next_run_time)})
-    return jsonify({'available': True, 'jobs': jobs})
+        return jsonify({'available': False, 'jobs': [], 'monitor_active': monitor_active()})
+    jobs = [{'id': j.id, 'next_run_time': str(j.next_run_time)} for j in scheduler.get_jobs()]
+    return jsonify({'available': True, 'jobs': jobs, 'monitor_active': monitor_active()})
 
 
 @app.route('/api/scheduler/force-schedule', methods=['POST'])
@@ -492,14 +1308,14 @@ def api_simulate_play():
 
     Accepts JSON: {"file": "azan.mp3", "ts": "optional ISO timestamp"}
     If `ts` is omitted, uses current time in local timezone.
-    This endpoint appends into `logs/play_history.json` and returns the last entries.
+    This endpoint appends into `logs/play_history.jsonl` and returns the last entries.
     """
     try:
         data = request.get_json(silent=True) or {}
         fname = (data.get('file') or 'azan.mp3').strip()
         ts_str = data.get('ts')
         try:
-            tz = get_localzone()
+            tz = get_prayer_tz()
         except Exception:
             tz = None
         if ts_str:
@@ -518,326 +1334,535 @@ def api_simulate_play():
             logger.warning(f"Failed to append simulated play history: {e}")
             return jsonify({'status': 'error', 'message': str(e)}), 500
         # Return recent history tail
-        path = os.path.join('logs', 'play_history.json')
-        recent = []
         try:
-            with open(path, 'r') as f:
-                recent = json.load(f)
+            recent = _tail_history(10)
         except Exception:
             recent = []
-        return jsonify({'status': 'ok', 'appended': {'file': fname, 'ts': when.isoformat()}, 'history_tail': recent[-10:]})
+        return jsonify({'status': 'ok', 'appended': {'file': fname, 'ts': when.isoformat()}, 'history_tail': recent})
     except Exception as e:
         logger.error(f"simulate-play error: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def _elect_coordinator(speakers):
+    """Pick the Azan coordinator: the first speaker that already coordinates a group, else the first speaker."""
+    return next((s for s in speakers if s.is_coordinator), speakers[0])
+
+def _speakers_to_join(coordinator, speakers):
+    """Return the speakers not already in `coordinator`'s group (one topology read, no joins)."""
+    try:
+        grouped = {m.uid for m in coordinator.group.members}
+    except Exception as e:
+        logger.warning("Could not read group topology for %s: %s", coordinator.player_name, e)
+        grouped = {coordinator.uid}
+    return [s for s in speakers if s.uid not in grouped]
+
 @app.route('/api/prepare', methods=['GET'])
 def prepare_group():
     """
     Called 1 minute before Azan.
-    Groups all available speakers to the Coordinator (first found).
+    Groups all available speakers to the elected Coordinator (the same one /api/play uses).
     """
-    global SONOS_GROUPS
+    result, status = _do_prepare()
+    return jsonify(result), status
+
+
+def _do_prepare():
+    """Group the speakers for the Azan; returns `(payload, http_status)` like `_do_play`."""
     logger.info("Preparing Zones for Azan...")
     
     try:
         speakers = get_sonos_speakers()
         if not speakers:
-            return jsonify({"status": "error", "message": "No speakers found"}), 404
+            return {"status": "error", "message": "No speakers found"}, 404
 
         # 1. Snapshot current state (volume, URI, position) logic omitted for brevity in V1, 
         #    but we just group them now.
         
-        coordinator = speakers[0]
-        logger.info(f"Elected Coordinator: {coordinator.player_name}")
+        coordinator = _elect_coordinator(speakers)
+        logger.info("Elected Coordinator: %s", coordinator.player_name)
 
-        # 2. Join all others to coordinator
-        for s in speakers[1:]:
-            logger.info(f"Joining {s.player_name} to {coordinator.player_name}")
-            try:
-                s.join(coordinator)
-            except Exception as e:
-                logger.warning(f"Failed to join {s.player_name}: {e}")
+        # 2. Join all others to coordinator (in parallel; each join is a SOAP round-trip).
+        #    Speakers already in the coordinator's group are skipped: one topology read
+        #    replaces a redundant SetAVTransportURI per grouped speaker.
+        members = _speakers_to_join(coordinator, speakers)
+        for s in members:
+            logger.info("Joining %s to %s", s.player_name, coordinator.player_name)
+        failed = []
+        for s, _, err in _for_each_speaker(lambda s: s.join(coordinator), members):
+            if err is not None:
+                logger.warning("Failed to join %s: %r", s.player_name, err)
+                failed.append(s.player_name)
+        if failed:
+            invalidate_sonos_cache()
 
-        return jsonify({"status": "success", "message": "Zones Grouped", "coordinator": coordinator.player_name})
+        return {"status": "success", "message": "Zones Grouped", "coordinator": coordinator.player_name,
+                "joined": len(members) - len(failed), "failed": failed}, 200
 
     except Exception as e:
-        logger.error(f"Prepare Error: {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        logger.error("Prepare Error: %s", e)
+        return {"status": "error", "message": str(e)}, 500
+
+# DIDL-Lite metadata shown on the speakers while the Azan plays. Only the URL varies
+# (local IP + file), so each formatted document is built once and reused.
+AZAN_TITLE = "Azan by Bilal App"
+_DIDL_TEMPLATE = """<DIDL-Lite xmlns="urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/" xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:upnp="urn:schemas-upnp-org:metadata-1-0/upnp/">
+<item id="0" parentID="0" restricted="0">
+<dc:title>{title}</dc:title>
+<upnp:class>object.item.audioItem</upnp:class>
+<res protocolInfo="http-get:*:audio/mpeg:*">{url}</res>
+</item>
+</DIDL-Lite>"""
+
+# Bounded: the URL changes with the local IP, which is now re-detected periodically
+@functools.lru_cache(maxsize=8)
+def _didl_metadata(audio_url):
+    return _DIDL_TEMPLATE.format(title=AZAN_TITLE, url=audio_url)
 
 @app.route('/api/play', methods=['POST'])
 def play_audio():
     """
     Plays the Azan audio file on the group.
     """
-    global PLAYBACK_ACTIVE, AZAN_LOCK
-    if AZAN_LOCK:
+    data = request.get_json(silent=True) or {}
+    result, status = _do_play(data.get('file'))
+    return jsonify(result), status
+
+
+@app.route('/api/cancel', methods=['POST'])
+def cancel_azan():
+    """Stop the in-progress Azan early and restore the speakers, whichever worker is playing it."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        sock.sendto(b'cancel', AZAN_CANCEL_NAME)
+    except OSError:
+        # Nobody has the name bound: no process is playing an Azan
+        return jsonify({"status": "error", "message": "No Azan in progress."}), 409
+    finally:
+        sock.close()
+    logger.info("Azan cancel requested")
+    return jsonify({"status": "success", "message": "Cancel requested"})
+
+
+def _scheduled_play(filename):
+    """APScheduler job: start the Azan in-process (no HTTP round-trip to /api/play)."""
+    try:
+        result, status = _do_play(filename)
+        logger.info("Scheduled play triggered for %s: %s %s", filename, status, result)
+    except Exception as e:
+        logger.error("Scheduled play failed for %s: %s", filename, e)
+
+
+def _do_play(requested):
+    """Start the Azan on the speakers and hand off to the playback monitor.
+
+    Returns `(payload, http_status)`; shared by the /api/play route and scheduled jobs.
+    """
+    if not AZAN.try_acquire():
         logger.warning("Azan already in progress, blocking duplicate playback.")
-        return jsonify({"status": "error", "message": "Azan in progress, playback blocked."}), 429
-    data = request.json
+        return {"status": "error", "message": "Azan in progress, playback blocked."}, 429
+    handed_off = False
+    try:
+        result = _start_azan(requested)
+        handed_off = result[1] == 200
+        return result
+    finally:
+        # Every path that does not reach the monitor frees the slot again
+        if not handed_off:
+            AZAN.release()
+
+
+def _start_azan(requested):
+    """Body of `_do_play`, run while holding the Azan slot."""
     # Incoming requests may specify prayer-specific filenames (e.g. dhuhr.mp3).
     # The deployment only contains two files:
     # - `fajr.mp3` for Fajr
     # - `azan.mp3` for all other Azan times
-    requested = (data.get('file') or 'fajr.mp3').strip()
+    requested = (requested or 'fajr.mp3').strip()
     # Normalize and map to available files
     if 'fajr' in requested.lower():
         filename = 'fajr.mp3'
     else:
         filename = 'azan.mp3'
 
-    logger.info(f"Received Play Request: {requested} -> mapped to: {filename}")
+    logger.info("Received Play Request: %s -> mapped to: %s", requested, filename)
 
     try:
         speakers = get_sonos_speakers()
         if not speakers:
             logger.error("No speakers found for Azan playback")
-            return jsonify({"status": "error", "message": "No speakers"}), 404
+            return {"status": "error", "message": "No speakers"}, 404
 
-        # Snapshot all zones: volume, uri, position
-        global SONOS_SNAPSHOT
-        SONOS_SNAPSHOT = {}
-        AZAN_LOCK = True
+        # Snapshot every zone with SoCo's Snapshot (volume, mute, EQ and, for group
+        # coordinators, the playing media and position) plus the group it belonged to
+        snapshot = {}
         error_count = 0
         logger.info("Starting snapshot of current Sonos state")
         
         # Find the coordinator
-        coordinator = next((s for s in speakers if s.is_coordinator), speakers[0])
-        logger.info(f"Coordinator: {coordinator.player_name}")
-        
-        # Get coordinator's track and transport info
-        track_info = coordinator.get_current_track_info()
-        transport_info = coordinator.get_current_transport_info()
-        logger.info(f"Coordinator track: uri={track_info.get('uri')}, position={track_info.get('position')}, state={transport_info.get('current_transport_state')}")
-        
-        for s in speakers:
-            try:
-                SONOS_SNAPSHOT[s.uid] = {
-                    "volume": s.volume,
-                    "uri": track_info.get("uri"),
-                    "position": track_info.get("position"),
-                    "state": transport_info.get("current_transport_state")
-                }
-                logger.info(f"Snapped {s.player_name}: vol={s.volume}, uri={track_info.get('uri')}, position={track_info.get('position')}")
-                # Set volume to 50%
+        coordinator = _elect_coordinator(speakers)
+        logger.info("Coordinator: %s", coordinator.player_name)
+
+        def _snap_and_set_volume(s):
+            snap = Snapshot(s, snapshot_queue=False)
+            snap.snapshot()
+            group_coordinator = s.group.coordinator if s.group else s
+            # Set volume to 50% (skip the write when it is already there)
+            if snap.volume != 50:
                 s.volume = 50
-                logger.info(f"Set volume to 50% for {s.player_name}")
-            except Exception as e:
-                logger.warning(f"Snapshot failed for {s.player_name}: {e}")
+            return {"snap": snap, "group_coordinator": group_coordinator}
+
+        for s, entry, err in _for_each_speaker(_snap_and_set_volume, speakers, timeout=SONOS_SNAPSHOT_TIMEOUT):
+            if err is not None:
+                logger.warning("Snapshot failed for %s: %r", s.player_name, err)
                 error_count += 1
+                continue
+            snapshot[s.uid] = entry
+            snap = entry["snap"]
+            logger.debug("Snapped %s: vol=%s, uri=%s, state=%s; set volume to 50%%", s.player_name, snap.volume, snap.media_uri, snap.transport_state)
+        logger.info("Snapshot taken for %s/%s speakers", len(speakers) - error_count, len(speakers))
+        if error_count:
+            # A speaker that stopped answering may have changed IP; re-discover next time
+            invalidate_sonos_cache()
         if error_count == len(speakers):
             logger.error("Failed to snapshot any speakers")
-            AZAN_LOCK = False
-            return jsonify({"status": "error", "message": "Failed to snapshot all speakers."}), 500
+            return {"status": "error", "message": "Failed to snapshot all speakers."}, 500
 
         # Use the elected coordinator determined earlier (do not overwrite)
         local_ip = get_local_ip()
         audio_url = f"http://{local_ip}:5000/audio/{filename}"
-        logger.info(f"Playing URL: {audio_url} on {coordinator.player_name}")
+        logger.info("Playing URL: %s on %s", audio_url, coordinator.player_name)
 
         # Set metadata for display
-        title = "Azan by Bilal App"
-        meta = f"""<DIDL-Lite xmlns="urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/" xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:upnp="urn:schemas-upnp-org:metadata-1-0/upnp/">
-<item id="0" parentID="0" restricted="0">
-<dc:title>{title}</dc:title>
-<upnp:class>object.item.audioItem</upnp:class>
-<res protocolInfo="http-get:*:audio/mpeg:*">{audio_url}</res>
-</item>
-</DIDL-Lite>"""
+        meta = _didl_metadata(audio_url)
 
         try:
             coordinator.play_uri(audio_url, meta=meta)
-            # Give the speaker a short moment to accept the URI and update state
-            time.sleep(1)
-            # Verify the coordinator actually loaded/started the Azan URI
+            # Verify the coordinator actually loaded/started the Azan URI, polling briefly
+            # instead of sleeping a fixed second
             try:
-                post_track = coordinator.get_current_track_info()
-                post_transport = coordinator.get_current_transport_info()
-                post_uri = post_track.get('uri') or ''
-                post_state = post_transport.get('current_transport_state')
-                logger.info(f"Post-play check: uri={post_uri}, state={post_state}")
+                post_uri, post_state = _wait_for_azan_start(coordinator, audio_url)
+                logger.info("Post-play check: uri=%s, state=%s", post_uri, post_state)
                 # Consider start successful only if the coordinator reports the Azan URI or is PLAYING
                 if (audio_url in post_uri) or (post_state == 'PLAYING'):
-                    AZAN_STARTED = True
+                    with AZAN.lock:
+                        AZAN.started = True
                     logger.info("Azan start confirmed on coordinator")
                     # Record play history for scheduling decisions (mark when playback actually started)
-                    try:
-                        _append_play_history(filename, when=datetime.now(tz))
-                    except Exception:
-                        pass
+                    PLAY_HISTORY_POOL.submit(_append_play_history, filename, datetime.now().astimezone())
                 else:
                     # Treat as failure: do not retry later
                     logger.error("Coordinator did not start Azan (URI/state mismatch). Aborting single attempt.")
-                    AZAN_LOCK = False
-                    AZAN_STARTED = False
-                    return jsonify({"status": "error", "message": "Azan playback failed to start."}), 500
+                    return {"status": "error", "message": "Azan playback failed to start."}, 500
             except Exception as e:
-                logger.error(f"Post-play verification failed: {e}")
-                AZAN_LOCK = False
-                AZAN_STARTED = False
-                return jsonify({"status": "error", "message": "Azan playback verification failed."}), 500
+                logger.error("Post-play verification failed: %s", e)
+                return {"status": "error", "message": "Azan playback verification failed."}, 500
         except Exception as e:
-            logger.error(f"Azan playback failed: {e}")
-            # Clear lock and do NOT retry — caller wanted single-attempt semantics
-            AZAN_LOCK = False
-            AZAN_STARTED = False
-            return jsonify({"status": "error", "message": "Azan playback failed."}), 500
+            logger.error("Azan playback failed: %s", e)
+            # Do NOT retry — caller wanted single-attempt semantics
+            return {"status": "error", "message": "Azan playback failed."}, 500
 
         # Start Monitoring Thread
-        PLAYBACK_ACTIVE = True
-        threading.Thread(target=monitor_playback, args=(coordinator, speakers, audio_url)).start()
+        _enqueue_monitor(coordinator, speakers, audio_url, snapshot)
+
+        return {"status": "success", "message": "Playback Started"}, 200
+
+    except Exception as e:
+        logger.error("Play Error: %s", e)
+        return {"status": "error", "message": str(e)}, 500
+
+def _wait_for_azan_start(coordinator, audio_url, timeout=2.0, interval=0.1):
+    """Poll the coordinator until it reports the Azan URI or PLAYING, or `timeout` passes.
+
+    Returns the last observed `(uri, state)`; re-raises the last error if no poll succeeded.
+    """
+    deadline = time.monotonic() + timeout
+    uri, state = '', None
+    polled_ok = False
+    last_err = None
+    while True:
+        try:
+            uri = coordinator.get_current_track_info().get('uri') or ''
+            # The loaded URI alone confirms the start; only ask for the state when it does not match
+            if audio_url in uri:
+                return uri, state
+            state = coordinator.get_current_transport_info().get('current_transport_state')
+            polled_ok = True
+            if state == 'PLAYING':
+                return uri, state
+        except Exception as e:
+            last_err = e
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(interval)
+    if not polled_ok and last_err is not None:
+        raise last_err
+    logger.warning("Coordinator did not confirm Azan start within %ss", timeout)
+    return uri, state
+
+# Monitoring runs on a bounded, long-lived pool instead of a fresh thread per play. One
+# worker serializes monitors, so a play that arrives while a previous monitor is still
+# restoring is queued behind it rather than racing on the playback globals.
+MONITOR_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix='azan-monitor')
+_MONITOR_FUTURE = None
+atexit.register(MONITOR_POOL.shutdown, wait=False)
+
+def _run_monitor(coordinator, speakers, audio_url, snapshot):
+    try:
+        monitor_playback(coordinator, speakers, audio_url, snapshot)
+    except Exception as e:
+        logger.error("Monitor worker error: %s", e)
+        # Never leave the Azan slot claimed after a crashed monitor
+        AZAN.release()
+
+def monitor_active():
+    """Return True while a playback monitor is running or queued in this process."""
+    return _MONITOR_FUTURE is not None and not _MONITOR_FUTURE.done()
+
+def _enqueue_monitor(coordinator, speakers, audio_url, snapshot):
+    """Submit a playback monitor task to MONITOR_POOL."""
+    global _MONITOR_FUTURE
+    if monitor_active():
+        logger.warning("Previous playback monitor still active; new monitor will run after it")
+    _MONITOR_FUTURE = MONITOR_POOL.submit(_run_monitor, coordinator, speakers, audio_url, snapshot)
+
+MONITOR_POLL_INTERVAL = 3  # seconds between polls when events are unavailable
+MONITOR_EVENT_HEARTBEAT = 15  # with events, still re-check state at least this often
+
+def _subscribe_transport_events(coordinator):
+    """Subscribe to the coordinator's AVTransport events, or return None to fall back to polling."""
+    try:
+        return coordinator.avTransport.subscribe(auto_renew=True)
+    except Exception as e:
+        logger.warning("AVTransport event subscription failed (%s); falling back to polling", e)
+        return None
+
+def _wait_for_transport_event(sub, timeout):
+    """Block until an AVTransport event arrives or `timeout` elapses; drain any backlog.
 
-        return jsonify({"status": "success", "message": "Playback Started"})
+    Returns the merged event variables (newest wins), or None if no event arrived.
+    """
+    try:
+        event = sub.events.get(timeout=timeout)
+    except queue.Empty:
+        return None
+    variables = dict(getattr(event, 'variables', None) or {})
+    while True:
+        try:
+            event = sub.events.get_nowait()
+        except queue.Empty:
+            return variables
+        variables.update(getattr(event, 'variables', None) or {})
+
+def _wait_for_transport_state(speaker, states, sub=None, timeout=3.0, interval=0.2):
+    """Wait until `speaker` reports one of `states`, up to `timeout` seconds.
+
+    Wakes on AVTransport events when `sub` is given, otherwise polls every `interval`.
+    Returns True once a matching state is seen, False on timeout.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        if sub is not None:
+            variables = _wait_for_transport_event(sub, max(0.0, min(interval * 5, deadline - time.monotonic())))
+            if variables and variables.get('transport_state') in states:
+                return True
+        try:
+            if speaker.get_current_transport_info().get('current_transport_state') in states:
+                return True
+        except Exception as e:
+            logger.debug("Transport state check failed for %s: %s", speaker.player_name, e)
+        if time.monotonic() >= deadline:
+            return False
+        if sub is None:
+            time.sleep(interval)
+
+def _hms_to_sec(value):
+    """Parse a Sonos H:MM:SS string into seconds, or return None if it is not in that form."""
+    h, _, rest = (value or '').partition(':')
+    m, _, sec = rest.partition(':')
+    try:
+        return int(h)*3600 + int(m)*60 + int(sec)
+    except ValueError:
+        return None
+
+def _advance_position(position, seconds):
+    """Return the H:MM:SS `position` moved forward by `seconds` (unchanged if unparseable)."""
+    total = _hms_to_sec(position)
+    if total is None:
+        return position
+    total += int(seconds)
+    return f"{total // 3600}:{total % 3600 // 60:02d}:{total % 60:02d}"
+
+SONOS_SNAPSHOT_TIMEOUT = 6.0  # a SoCo Snapshot is several SOAP reads per speaker
+SONOS_RESTORE_TIMEOUT = 15.0  # restore may reload media and seek per speaker
 
+def _restore_speaker(s, entry, coordinator):
+    """Take `s` out of the Azan group and restore its SoCo snapshot (volume, mute, EQ, media)."""
+    if not entry:
+        logger.warning("No snapshot found for %s", s.player_name)
+        return
+    if s.uid != coordinator.uid:
+        try:
+            s.unjoin()
+            logger.debug("Ungrouped %s", s.player_name)
+        except Exception as e:
+            logger.warning("Ungroup failed for %s: %s", s.player_name, e)
+    snap = entry["snap"]
+    try:
+        snap.restore(fade=False)
+        logger.info("Restored %s: uri=%s, state=%s", s.player_name, snap.media_uri, snap.transport_state)
     except Exception as e:
-        logger.error(f"Play Error: {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        logger.warning("Restore failed for %s: %s", s.player_name, e)
+
+def _rejoin_original_group(s, entry):
+    """Re-join `s` to the group coordinator it followed before the Azan, if any."""
+    original = entry["group_coordinator"] if entry else None
+    if original is not None and original.uid != s.uid:
+        s.join(original)
+        logger.debug("Re-joined %s to %s", s.player_name, original.player_name)
 
-def monitor_playback(coordinator, speakers, audio_url):
+def monitor_playback(coordinator, speakers, audio_url, snapshot):
     """
-    Monitors playback for 3 minutes, enforcing Azan priority by overriding interruptions and resuming from interrupted position.
-    Restores state after the full duration.
+    Monitors playback for the Azan length (at least 3 minutes), enforcing Azan priority by overriding interruptions and resuming from interrupted position.
+    State is re-checked on AVTransport events (plus a slow heartbeat), or polled if subscribing fails.
+    Restores `snapshot` (taken by `_start_azan` for this cycle) after the full duration.
     """
-    global PLAYBACK_ACTIVE, SONOS_SNAPSHOT, AZAN_LOCK
+    global _MONITOR_SUB
     logger.info("Playback Monitor Started...")
-    logger.info(f"Monitoring Azan URI: {audio_url}")
+    logger.debug("Monitoring Azan URI: %s", audio_url)
+    # The loop polls every few seconds; keep repeated per-iteration notices out of the log
+    rl_log = RateLimitedLogger(logger, interval=30.0)
     start_time = time.time()
-    duration = 180  # 3 minutes
+    # Length of the Azan file when known from its MP3 header; otherwise read once from the
+    # first Azan track info. The monitor window covers at least 3 minutes and the whole file.
+    known_length = AUDIO_DURATIONS.get(audio_url.rsplit('/', 1)[-1])
+    duration = max(180, int(known_length) + 30) if known_length else 180
     last_azan_position = None
+    last_position_at = None
+    azan_duration_seconds = int(known_length) if known_length else None
     resume_attempted = False
-    while time.time() - start_time < duration:
-        try:
-            info = coordinator.get_current_transport_info()
-            state = info['current_transport_state']
-            track_info = coordinator.get_current_track_info()
-            current_uri = track_info.get('uri')
-            logger.debug(f"Playback state: {state}, URI: {current_uri}")
-            if state == 'STOPPED' and current_uri == audio_url:
-                logger.info("Azan finished and stopped, starting restore immediately")
+    # Wake on AVTransport events instead of polling every few seconds (polling is the fallback)
+    sub = _MONITOR_SUB = _subscribe_transport_events(coordinator)
+    event_vars = None
+    try:
+        while time.time() - start_time < duration:
+            if AZAN.stop.is_set():
+                logger.info("Azan cancelled, starting restore immediately")
                 break
-            if current_uri == audio_url:
-                # Get Azan duration
-                duration_str = track_info.get('duration', '0:02:10')
-                duration_parts = duration_str.split(':')
-                if len(duration_parts) == 3:
-                    azan_duration_seconds = int(duration_parts[0])*3600 + int(duration_parts[1])*60 + int(duration_parts[2])
-                else:
-                    azan_duration_seconds = 130  # default
-                # Update last known Azan position
-                last_azan_position = track_info.get('position', '0:00:00')
-                # Check if Azan is near end
-                pos_str = last_azan_position
-                pos_parts = pos_str.split(':')
-                if len(pos_parts) == 3:
-                    pos_seconds = int(pos_parts[0])*3600 + int(pos_parts[1])*60 + int(pos_parts[2])
-                    if pos_seconds >= azan_duration_seconds:
-                        logger.info(f"Azan position {pos_str} >= {azan_duration_seconds}s, Azan finished")
+            try:
+                # Prefer the state/URI pushed in the event; query the speaker only when it is missing
+                track_info = None
+                state = current_uri = None
+                if event_vars:
+                    state = event_vars.get('transport_state')
+                    current_uri = event_vars.get('current_track_uri')
+                if state is None or current_uri is None:
+                    info = coordinator.get_current_transport_info()
+                    state = info['current_transport_state']
+                    track_info = coordinator.get_current_track_info()
+                    current_uri = track_info.get('uri')
+                logger.debug("Playback state: %s, URI: %s", state, current_uri)
+                if state == 'STOPPED' and current_uri == audio_url:
+                    logger.info("Azan finished and stopped, starting restore immediately")
+                    break
+                if current_uri == audio_url:
+                    if track_info is None:
+                        track_info = coordinator.get_current_track_info()
+                    if azan_duration_seconds is None:
+                        azan_duration_seconds = _hms_to_sec(track_info.get('duration')) or 130  # default
+                    # Update last known Azan position
+                    last_azan_position = track_info.get('position', '0:00:00')
+                    last_position_at = time.monotonic()
+                    # Check if Azan is near end
+                    pos_seconds = _hms_to_sec(last_azan_position)
+                    if pos_seconds is not None and pos_seconds >= azan_duration_seconds:
+                        logger.info("Azan position %s >= %ss, Azan finished", last_azan_position, azan_duration_seconds)
                         break
-            elif current_uri != audio_url:
-                # Only attempt a single controlled resume if the Azan actually started previously
-                logger.info(f"Detected non-Azan URI: {current_uri}. last_azan_position={last_azan_position}, AZAN_STARTED={AZAN_STARTED}, resume_attempted={resume_attempted}")
-                if not AZAN_STARTED:
-                    logger.info("Azan was never started successfully; skipping restart attempt.")
-                elif resume_attempted:
-                    logger.info("Resume already attempted once; skipping further resume attempts.")
-                elif not last_azan_position or last_azan_position == '0:00:00':
-                    logger.info("No valid last Azan position available; skipping resume to avoid restarting from beginning.")
-                else:
-                    logger.info(f"Attempting single resume of Azan from position {last_azan_position}.")
-                    resume_attempted = True
-                    try:
-                        # Force resume Azan once from last known position
-                        coordinator.stop()
-                        time.sleep(1)
-                        title = "Azan by Bilal App"
-                        meta = f"""<DIDL-Lite xmlns="urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/" xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:upnp="urn:schemas-upnp-org:metadata-1-0/upnp/">
-<item id="0" parentID="0" restricted="0">
-<dc:title>{title}</dc:title>
-<upnp:class>object.item.audioItem</upnp:class>
-<res protocolInfo="http-get:*:audio/mpeg:*">{audio_url}</res>
-</item>
-</DIDL-Lite>"""
-                        coordinator.play_uri(audio_url, meta=meta)
-                        # Wait briefly and attempt to seek to last position; if seek fails, do NOT retry
-                        time.sleep(1)
+                elif current_uri != audio_url:
+                    # Only attempt a single controlled resume if the Azan actually started previously
+                    rl_log.log(logging.INFO, 'non-azan', "Detected non-Azan URI: %s. last_azan_position=%s, started=%s, resume_attempted=%s", current_uri, last_azan_position, AZAN.started, resume_attempted)
+                    if not AZAN.started:
+                        rl_log.log(logging.INFO, 'not-started', "Azan was never started successfully; skipping restart attempt.")
+                    elif resume_attempted:
+                        rl_log.log(logging.DEBUG, 'resumed', "Resume already attempted once; skipping further resume attempts.")
+                    elif not last_azan_position or last_azan_position == '0:00:00':
+                        rl_log.log(logging.INFO, 'no-position', "No valid last Azan position available; skipping resume to avoid restarting from beginning.")
+                    else:
+                        if sub is not None and last_position_at is not None:
+                            # With events the position is sampled sparsely; advance it by the time
+                            # the Azan kept playing until this interruption was reported
+                            last_azan_position = _advance_position(last_azan_position, time.monotonic() - last_position_at)
+                        logger.info("Attempting single resume of Azan from position %s.", last_azan_position)
+                        resume_attempted = True
                         try:
-                            coordinator.seek(last_azan_position)
-                            logger.info(f"Seeked to {last_azan_position}")
+                            # Force resume Azan once from last known position
+                            coordinator.stop()
+                            _wait_for_transport_state(coordinator, ('STOPPED',), sub=sub)
+                            coordinator.play_uri(audio_url, meta=_didl_metadata(audio_url))
+                            # Wait until playback starts and attempt to seek to last position; if seek fails, do NOT retry
+                            _wait_for_transport_state(coordinator, ('PLAYING',), sub=sub)
+                            try:
+                                coordinator.seek(last_azan_position)
+                                logger.info("Seeked to %s", last_azan_position)
+                            except Exception as e:
+                                logger.warning("Seek failed during single-resume attempt: %s. Will not retry to avoid restarting from beginning.", e)
+                            # Re-group if needed (best-effort)
+                            members = _speakers_to_join(coordinator, speakers)
+                            for s, _, err in _for_each_speaker(lambda s: s.join(coordinator), members):
+                                if err is not None:
+                                    logger.warning("Re-group failed for %s: %s", s.player_name, err)
                         except Exception as e:
-                            logger.warning(f"Seek failed during single-resume attempt: {e}. Will not retry to avoid restarting from beginning.")
-                        # Re-group if needed (best-effort)
-                        for s in speakers:
-                            if s != coordinator and not s.is_coordinator:
-                                try:
-                                    s.join(coordinator)
-                                except Exception as e:
-                                    logger.warning(f"Re-group failed for {s.player_name}: {e}")
-                    except Exception as e:
-                        logger.error(f"Single resume attempt failed: {e}. Skipping further resume attempts.")
-            time.sleep(3)
-        except Exception as e:
-            logger.error(f"Monitor Error: {e}")
-            break
-    # After 3 minutes, restore
-    logger.info("Azan duration completed. Starting restore process...")
-    PLAYBACK_ACTIVE = False
-    AZAN_LOCK = False
-    # Restore all zones
-    for s in speakers:
-        snap = SONOS_SNAPSHOT.get(s.uid)
-        if snap:
-            logger.info(f"Restoring {s.player_name} with snapshot: {snap}")
+                            logger.error("Single resume attempt failed: %s. Skipping further resume attempts.", e)
+                if sub is not None:
+                    remaining = duration - (time.time() - start_time)
+                    event_vars = _wait_for_transport_event(sub, max(0.0, min(MONITOR_EVENT_HEARTBEAT, remaining)))
+                else:
+                    AZAN.stop.wait(MONITOR_POLL_INTERVAL)
+            except Exception as e:
+                logger.error("Monitor Error: %s", e)
+                break
+    finally:
+        # Always drop the subscription, even if the loop raised unexpectedly
+        _MONITOR_SUB = None
+        if sub is not None:
             try:
-                s.volume = snap["volume"]
-                logger.info(f"Restored volume to {snap['volume']} for {s.player_name}")
+                sub.unsubscribe()
             except Exception as e:
-                logger.warning(f"Restore volume failed for {s.player_name}: {e}")
-            # Ungroup first
-            if s != coordinator:
-                try:
-                    s.unjoin()
-                    logger.info(f"Ungrouped {s.player_name}")
-                except Exception as e:
-                    logger.warning(f"Ungroup failed for {s.player_name}: {e}")
-            # Resume previous music/radio if was playing
-            if snap["state"] == "PLAYING" and snap["uri"]:
-                # Determine whether the snapped URI is a local audio file served by this app
-                # or an external/streaming URI (radio). For streaming URIs we should not
-                # attempt to seek back to a saved position because live streams either
-                # don't support seeking or seeking would restart the stream.
-                uri = snap["uri"] or ''
-                is_stream = ('sid=' in uri) or ('/audio/' not in uri)
-                if is_stream:
-                    logger.info(f"Skipping seek/position restore for streaming URI: {uri} for {s.player_name}")
-                    try:
-                        # Best-effort: restore the URI so the speaker returns to the same stream
-                        s.play_uri(uri)
-                        logger.info(f"Restored streaming URI for {s.player_name}: {uri}")
-                    except Exception as e:
-                        logger.warning(f"Restore streaming URI failed for {s.player_name}: {e}")
-                else:
-                    logger.info(f"Attempting to resume {uri} at {snap['position']} for {s.player_name}")
-                    try:
-                        s.play_uri(uri)
-                        # Only attempt to seek for local/audio files where stored positions make sense
-                        if snap["position"] and snap["position"] != 'NOT_IMPLEMENTED':
-                            time.sleep(1)
-                            s.seek(snap["position"])
-                            logger.info(f"Seeked to {snap['position']} for {s.player_name}")
-                        logger.info(f"Resumed playback for {s.player_name}: {uri} at {snap['position']}")
-                    except Exception as e:
-                        logger.warning(f"Restore playback failed for {s.player_name}: {e}")
-            else:
-                logger.info(f"No playback to resume for {s.player_name} (state: {snap['state']}, uri: {snap['uri']})")
-        else:
-            logger.warning(f"No snapshot found for {s.player_name}")
+                logger.debug("AVTransport unsubscribe failed: %s", e)
+    # After 3 minutes, restore
+    logger.info("Azan duration completed. Starting restore process...")
+    AZAN.release()
+    # Restore all zones in parallel; each speaker's steps stay ordered inside its worker.
+    # `snapshot` is this cycle's own copy, so a following Azan that claims the released slot
+    # cannot change what is restored here.
+    for s, _, err in _for_each_speaker(lambda s: _restore_speaker(s, snapshot.get(s.uid), coordinator), speakers, timeout=SONOS_RESTORE_TIMEOUT):
+        if err is not None:
+            logger.warning("Restore failed for %s: %r", s.player_name, err)
+    # Followers re-join their original coordinators only after every coordinator is standalone again
+    for s, _, err in _for_each_speaker(lambda s: _rejoin_original_group(s, snapshot.get(s.uid)), speakers):
+        if err is not None:
+            logger.warning("Re-join to original group failed for %s: %r", s.player_name, err)
     logger.info("Azan playback and restore completed")
 
 if __name__ == '__main__':
+    # Production runs under gunicorn (see gunicorn.conf.py); the Werkzeug server is for `--dev` only.
+    if '--dev' not in sys.argv:
+        # Run gunicorn from this interpreter (same virtualenv) and app directory, whatever
+        # PATH and the current directory are
+        app_dir = os.path.dirname(os.path.abspath(__file__))
+        if importlib.util.find_spec('gunicorn') is None:
+            logger.warning("gunicorn is not installed; falling back to the development server")
+        else:
+            try:
+                os.execv(sys.executable, [sys.executable, '-m', 'gunicorn', '--chdir', app_dir,
+                                          '-c', os.path.join(app_dir, 'gunicorn.conf.py'), 'server:app'])
+            except OSError as e:
+                logger.warning(f"Failed to exec gunicorn ({e}); falling back to the development server")
     logger.info("Server Starting on Port 5000...")
+    warmup_sonos()
     # Initialize and start scheduler if available
     if SCHEDULER_AVAILABLE:
         try:
-            scheduler = BackgroundScheduler()
+            scheduler = _create_scheduler()
             scheduler.start()
             logger.info("BackgroundScheduler started")
             # Schedule today's prayers and a daily rescheduler job
@@ -848,28 +1873,42 @@ if __name__ == '__main__':
     else:
         logger.info("Scheduler not available in this environment; automatic scheduling disabled")
 
-    app.run(host='0.0.0.0', port=5000)
+    if '--dev' not in sys.argv:
+        # gunicorn could not be exec'd; prefer waitress over the Werkzeug server when installed
+        try:
+            from waitress import serve
+        except ImportError:
+            serve = None
+        if serve is not None:
+            serve(app, host='0.0.0.0', port=5000, threads=8)
+            sys.exit(0)
+    app.run(host='0.0.0.0', port=5000, threaded=True)
 
 # When running under gunicorn (imported module), __name__ != '__main__'.
-# Start the scheduler in exactly one process by using a filesystem lock so
+# Start the scheduler in exactly one process by holding a singleton socket so
 # multiple gunicorn workers do not each start duplicate schedulers.
+_SCHEDULER_LOCK_SOCK = None
+# Abstract-namespace UNIX socket name: no file on disk, and the kernel frees it when the owner exits
+SCHEDULER_LOCK_NAME = '\0bilal-scheduler-lock'
+
 def _try_start_scheduler_with_lock():
-    global scheduler
-    LOCK_PATH = '/tmp/bilal_scheduler.lock'
+    global scheduler, _SCHEDULER_LOCK_SOCK
     if not SCHEDULER_AVAILABLE:
         logger.info('Scheduler not available; skipping automatic scheduler start')
         return
     try:
-        fd = open(LOCK_PATH, 'w')
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
         try:
-            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
-        except BlockingIOError:
+            sock.bind(SCHEDULER_LOCK_NAME)
+        except OSError:
             logger.info('Another process holds scheduler lock; not starting scheduler in this worker')
-            fd.close()
+            sock.close()
             return
+        # Keep the socket referenced; closing it would release the lock
+        _SCHEDULER_LOCK_SOCK = sock
         # We acquired the lock — start the scheduler in this process
         try:
-            scheduler = BackgroundScheduler()
+            scheduler = _create_scheduler()
             scheduler.start()
             logger.info('BackgroundScheduler started (lock owner)')
             schedule_today_and_rescheduler()
@@ -879,5 +1918,7 @@ def _try_start_scheduler_with_lock():
     except Exception as e:
         logger.warning(f'Failed to acquire/start scheduler lock: {e}')
 
-# Try to start scheduler now (safe for gunicorn workers)
-_try_start_scheduler_with_lock()
+# Try to start scheduler now (safe for gunicorn workers). With a preloaded app the
+# gunicorn config defers this to post_fork so the scheduler thread lives in a worker.
+if not os.environ.get('BILAL_DEFER_SCHEDULER'):
+    _try_start_scheduler_with_lock()